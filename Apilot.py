@@ -1,22 +1,77 @@
+import time
+_import_started = time.perf_counter()
+
 import plugins
 import requests
 import re
 import json
 import os
+import threading
+import itertools
+import hashlib
 from urllib.parse import urlparse
-from bridge.context import ContextType
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import partial
+from bridge.context import Context, ContextType
 from bridge.reply import Reply, ReplyType
-from channel import channel
 from common.log import logger
+from config import conf as global_conf
 from plugins import *
 from datetime import datetime, timedelta
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
-import io
-import base64
-import tempfile
+from .http_client import HttpClient, CircuitOpenError, HostBusyError
+from .cache import ResponseCache, TTLCache, SingleFlight, request_key, payload_date, STALE_MARKER
+from .scheduler import DailyScheduler
+from .image_store import ImageStore
+from .image_encoder import ImageEncoder, RENDER, DOWNLOAD
+from .router import CommandRouter
+from .executor import CommandExecutor, fan_out
+from .oil_price import OilPriceTable
+from .city_index import CityIndex
+from .word_index import WordIndex
+from .metrics import ApilotMetrics, StartupTimer
+from .express_tracker import ExpressTracker, FINAL_STATUSES
+from .persistent_cache import PersistentStore
+from .weather_cache import WeatherCache, TODAY, SEVEN
+from .token_pool import TokenPool, NoTokenAvailableError, with_token
+from .admission import Admission, ADMIT, SHED
+
+# 导入本模块及依赖的耗时；PIL 等重量级依赖在首次使用时才导入
+IMPORT_SECONDS = time.perf_counter() - _import_started
 
 BASE_URL_VVHAN = "https://api.vvhan.com/api/"
 BASE_URL_ALAPI = "https://v3.alapi.cn/api/"
+BASE_URL_DAYU = "https://dayu.qqsuu.cn/"
+
+# 这些错误表示请求没有真正发给上游，占用的 ALAPI token 需要归还
+UNSENT_ERRORS = (CircuitOpenError.__name__, HostBusyError.__name__)
+
+# 已校验过的图片/视频链接结果的缓存时间(秒)
+VALIDATED_URL_TTL = 600
+
+# 渲染结果按内容缓存的时间(秒)
+RENDER_CACHE_TTL = 86400
+
+# 异步模式下单个指令的默认截止时间(秒)
+DEFAULT_COMMAND_DEADLINE = 15
+
+# “全部热榜”中每个平台参与合并的条数，以及标题去重时忽略的字符
+HOT_TRENDS_PER_SOURCE = 15
+HOT_TITLE_NORMALIZE_RE = re.compile(r"[\s\W_]+")
+
+# 一条消息最多同时查询的城市数，以及并发查询共享的超时时间(秒)
+MAX_BATCH_CITIES = 8
+DEFAULT_BATCH_DEADLINE = 8
+
+# 查字典一次最多查询的字数，接口查询结果的缓存时间(秒)，字典数据基本不变
+MAX_WORD_CHARS = 10
+WORD_CACHE_TTL = 30 * 86400
+# 接口查不到的字也缓存一段时间，避免反复请求
+WORD_MISS_TTL = 86400
+CJK_CHAR_RE = re.compile(r"[\u3400-\u9fff\uf900-\ufaff\U00020000-\U0003134f]")
+
+# 每天预取十二星座运势的时间，以及一轮预取的超时时间(秒)
+DEFAULT_HOROSCOPE_PREFETCH_TIME = "00:10"
+HOROSCOPE_PREFETCH_TIMEOUT = 60
 
 
 @plugins.register(
@@ -31,21 +86,144 @@ class Apilot(Plugin):
     def __init__(self):
         super().__init__()
         try:
-            self.conf = super().load_config()
-            self.condition_2_and_3_cities = None  # 天气查询，存储重复城市信息，Initially set to None
+            timer = StartupTimer()
+            self.conf = self.load_config()
+            self.city_index = None  # 天气查询使用的城市索引，首次查询天气时加载
+            self._city_index_lock = threading.Lock()
+            self.word_index = None  # 查字典使用的本地字典，首次查字典时加载，没有字典文件时为 None
+            self._word_index_loaded = False
+            self._word_index_lock = threading.Lock()
+            # 一个或多个 ALAPI token，请求时按余量选择；各功能仍用 alapi_token 判断是否已配置 token
+            self.token_pool = TokenPool.from_config(self.conf, os.path.dirname(__file__))
             if not self.conf:
                 logger.warn("[Apilot] inited but alapi_token not found in config")
                 self.alapi_token = None  # Setting a default value for alapi_token
                 self.morning_news_text_enabled = False
             else:
                 logger.info("[Apilot] inited and alapi_token loaded successfully")
-                self.alapi_token = self.conf["alapi_token"]
+                self.alapi_token = self.token_pool.primary if self.token_pool else None
                 try:
                     self.morning_news_text_enabled = self.conf["morning_news_text_enabled"]
                 except:
                     self.morning_news_text_enabled = False
+            timer.mark("config")
+            # 上游接口地址，可在配置中覆盖，例如指向本地的测试桩
+            base_urls = (self.conf or {}).get("base_urls") or {}
+            self.base_url_vvhan = base_urls.get("vvhan", BASE_URL_VVHAN)
+            self.base_url_alapi = base_urls.get("alapi", BASE_URL_ALAPI)
+            self.base_url_dayu = base_urls.get("dayu", BASE_URL_DAYU)
+            # 指令耗时、上游请求、渲染和缓存命中等运行指标
+            self.metrics = ApilotMetrics()
+            # 所有上游请求共用一个带连接池、超时和重试的客户端
+            self.http = HttpClient.from_config(self.conf, metrics=self.metrics)
+            timer.mark("http")
+            # 可选的 SQLite 持久化，重启后恢复上游响应和渲染结果的缓存
+            self.persistent = PersistentStore.from_config(self.conf, os.path.dirname(__file__))
+            # 上游响应缓存，按接口配置不同的过期时间
+            self.response_cache = ResponseCache.from_config(self.conf, persistent=self.persistent)
+            # 按城市缓存的实时天气和七天预报，过期时间跟随上游的 update_time
+            self.weather_cache = WeatherCache.from_config(self.conf, persistent=self.persistent)
+            # 本地字典中没有、由接口查到的汉字，字 -> 字典信息
+            self.word_cache = TTLCache(max_entries=2048)
+            if self.persistent:
+                self.word_cache.attach(self.persistent, "word")
+            # 渲染结果，输入的哈希 -> 图片路径
+            self.render_cache = TTLCache(max_entries=64)
+            if self.persistent:
+                self.render_cache.attach(self.persistent, "render")
+            # 合并同时发起的相同上游请求和相同内容的渲染
+            self.request_flight = SingleFlight()
+            self.render_flight = SingleFlight()
+            # 下载和渲染的图片统一存放在插件缓存目录，限制总大小
+            self.image_store = ImageStore.from_config(self.conf, os.path.dirname(__file__))
+            # 油价表索引，(原始数据, OilPriceTable)
+            self._oil_table = None
+            # 最近校验过的图片/视频链接，URL -> 是否有效
+            self.validated_urls = TTLCache(max_entries=256)
+            # 渲染图片时是否叠加模糊阴影，关闭可明显降低 CPU 开销
+            self.render_shadow = (self.conf or {}).get("render_shadow", True)
+            # 发送前的图片编码，按图片来源和当前渠道选择格式、尺寸和字节预算
+            self.image_encoder = ImageEncoder.from_config(self.conf, global_conf().get("channel_type", ""))
+            timer.mark("stores")
+            # 早报图片按日期缓存，(日期, 图片路径)
+            self._morning_news_render = None
+            self._morning_news_lock = threading.Lock()
+            self.scheduler = DailyScheduler()
+            prerender_time = (self.conf or {}).get("morning_news_prerender_time")
+            if prerender_time:
+                self.scheduler.add_daily("morning_news", prerender_time, self.prerender_morning_news)
+            # 指令解析在初始化时预编译，指令名称 -> 处理函数
+            self.router = CommandRouter(is_city=self.is_known_city)
+            self.command_handlers = {
+                "morning_news": self.handle_morning_news,
+                "moyu": self.handle_moyu,
+                "moyu_video": self.handle_moyu_video,
+                "bagua": self.handle_bagua,
+                "express": self.handle_express,
+                "horoscope": self.handle_horoscope,
+                "hot_trends": self.handle_hot_trends,
+                "hot_trends_all": self.handle_hot_trends_all,
+                "word": self.handle_word,
+                "gold": self.handle_gold,
+                "oil": self.handle_oil,
+                "weather": self.handle_weather,
+                "weather_batch": self.handle_weather_batch,
+            }
+            # 需要知道消息来自哪个会话的指令，处理函数的第一个参数为消息上下文
+            self.context_handlers = {
+                "metrics": self.handle_metrics,
+                "express_subscribe": self.handle_express_subscribe,
+                "express_unsubscribe": self.handle_express_unsubscribe,
+                "express_list": self.handle_express_list,
+            }
+            # 快递订阅：后台轮询单号，有新动态时通过最近一次收到消息的 channel 推送
+            self.push_channel = None
+            self._push_contexts = {}  # 会话 -> 订阅时的消息上下文
+            self.express_tracker = ExpressTracker.from_config(self.conf, os.path.dirname(__file__),
+                                                              self.poll_express, self.push_express_update)
+            timer.mark("handlers")
+            # 异步模式：指令提交到有界线程池执行，不阻塞消息处理线程
+            conf = self.conf or {}
+            self.async_mode = conf.get("async_mode", False)
+            self.executor = None
+            if self.async_mode:
+                self.executor = CommandExecutor(max_workers=conf.get("worker_threads", 8),
+                                                max_pending=conf.get("max_pending_commands", 64))
+            self.sync_wait = conf.get("sync_wait", 1.0)
+            self.placeholder_text = conf.get("placeholder_text", "")
+            self.command_deadline = conf.get("command_deadline", DEFAULT_COMMAND_DEADLINE)
+            self.command_deadlines = conf.get("command_deadlines", {})
+            # 一条指令需要并发请求多个上游时(如多城市天气)使用的线程池
+            self.fanout_pool = ThreadPoolExecutor(max_workers=conf.get("fanout_threads", 16),
+                                                  thread_name_prefix="apilot-fanout")
+            self.batch_deadline = conf.get("batch_deadline", DEFAULT_BATCH_DEADLINE)
+            # “全部热榜”聚合的平台、单个平台的超时时间和返回条数
+            self.hot_trends_all_sources = conf.get("hot_trends_all_sources") or list(hot_trend_types)
+            self.hot_trends_source_timeout = conf.get("hot_trends_source_timeout", 3)
+            self.hot_trends_all_top_n = conf.get("hot_trends_all_top_n", 20)
+            # 当天预取的星座运势，(日期, {星座英文名: 回复文本})
+            self._horoscopes = (None, {})
+            self._horoscope_lock = threading.Lock()
+            self.horoscope_prefetch_concurrency = conf.get("horoscope_prefetch_concurrency", 4)
+            horoscope_prefetch_time = conf.get("horoscope_prefetch_time", DEFAULT_HOROSCOPE_PREFETCH_TIME)
+            if horoscope_prefetch_time:
+                self.scheduler.add_daily("horoscope", horoscope_prefetch_time, self.prefetch_horoscopes)
+            self.admin_users = set(conf.get("admin_users", []))
+            # 分发前的准入控制：按群和发送者限流，合并群内短时间内的重复指令；未开启时为 None
+            self.admission = Admission.from_config(conf)
+            if conf.get("metrics_file"):
+                self.metrics.start_file_export(conf["metrics_file"], conf.get("metrics_interval", 30))
+            if conf.get("metrics_port"):
+                self.metrics.start_http_export(conf["metrics_port"], conf.get("metrics_host", "127.0.0.1"))
             self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
-            logger.info("[Apilot] Plugin initialized successfully")
+            timer.mark("pools")
+            self.metrics.startup_seconds.set(IMPORT_SECONDS, "import")
+            timer.record(self.metrics.startup_seconds)
+            logger.info(f"[Apilot] Plugin initialized successfully, import {IMPORT_SECONDS * 1000:.1f}ms, "
+                        f"init {timer.summary()}")
+            # 可选的预热：在后台线程中导入渲染依赖、加载字体和城市索引，不阻塞插件加载
+            if conf.get("warm_up", False):
+                threading.Thread(target=self.warm_up, name="apilot-warmup", daemon=True).start()
         except Exception as e:
             logger.error(f"[Apilot] init failed: {e}")
             raise Exception(f"[Apilot] init failed: {e}")
@@ -54,155 +232,256 @@ class Apilot(Plugin):
         if e_context["context"].type not in [ContextType.TEXT]:
             return
         content = e_context["context"].content.strip()
-        logger.debug("[Apilot] on_handle_context. content: %s" % content)
-
-        if content == "早报":
-            news = self.get_morning_news(self.alapi_token, self.morning_news_text_enabled)
-            # 检查结果是否为本地文件路径（图片生成的结果）
-            if news and os.path.isfile(news):
-                reply = self.create_reply(ReplyType.IMAGE_PATH, news)
-            else:
-                # 保持原来的逻辑，检查是否为有效URL
-                reply_type = ReplyType.IMAGE_URL if self.is_valid_url(news) else ReplyType.TEXT
-                reply = self.create_reply(reply_type, news)
-            e_context["reply"] = reply
-            e_context.action = EventAction.BREAK_PASS  # 事件结束，并跳过处理context的默认逻辑
-            return
-        if content == "摸鱼":
-            moyu = self.get_moyu_calendar()
-            # 检查结果是否为本地文件路径
-            if moyu and os.path.isfile(moyu):
-                reply = self.create_reply(ReplyType.IMAGE_PATH, moyu)
-            else:
-                # 如果不是本地文件，检查是否为有效URL
-                reply_type = ReplyType.IMAGE_URL if self.is_valid_url(moyu) else ReplyType.TEXT
-                reply = self.create_reply(reply_type, moyu)
-            e_context["reply"] = reply
-            e_context.action = EventAction.BREAK_PASS  # 事件结束，并跳过处理context的默认逻辑
-            return
+        logger.debug("[Apilot] on_handle_context. content: %s", content)
 
-        if content == "摸鱼视频":
-            moyu = self.get_moyu_calendar_video()
-            reply_type = ReplyType.VIDEO_URL if self.is_valid_url(moyu) else ReplyType.TEXT
-            reply = self.create_reply(reply_type, moyu)
-            e_context["reply"] = reply
-            e_context.action = EventAction.BREAK_PASS  # 事件结束，并跳过处理context的默认逻辑
+        command = self.router.route(content)
+        if command is None:
             return
-
-        if content == "八卦":
-            bagua = self.get_mx_bagua()
-            # 检查结果是否为本地文件路径
-            if bagua and os.path.isfile(bagua):
-                reply = self.create_reply(ReplyType.IMAGE_PATH, bagua)
-            else:
-                # 如果不是本地文件，检查是否为有效URL
-                reply_type = ReplyType.IMAGE_URL if self.is_valid_url(bagua) else ReplyType.TEXT
-                reply = self.create_reply(reply_type, bagua)
-            e_context["reply"] = reply
-            e_context.action = EventAction.BREAK_PASS  # 事件结束，并跳过处理context的默认逻辑
+        if self.push_channel is None:
+            # 拿到 channel 后才能推送，此时再开始轮询重启前保存的快递订阅
+            self.push_channel = e_context["channel"]
+            if self.express_tracker.items:
+                self.express_tracker.start()
+        if not self.admit(command, e_context):
+            e_context.action = EventAction.BREAK_PASS
             return
+        if command.name in self.context_handlers:
+            handler = partial(self.context_handlers[command.name], e_context["context"])
+        else:
+            handler = self.command_handlers[command.name]
+        if self.executor:
+            self.run_async(command, handler, e_context)
+        else:
+            e_context["reply"] = self.run_command(command, handler)
+        e_context.action = EventAction.BREAK_PASS  # 事件结束，并跳过处理context的默认逻辑
+
+    def admit(self, command, e_context):
+        """准入检查，未通过时按需回复限流提示，返回是否继续执行指令"""
+        context = e_context["context"]
+        chat_id, user_id = self.sender_ids(context)
+        # 未开启准入控制、无法识别会话的消息和管理员不做限制
+        if self.admission is None or not chat_id or self.is_admin(context):
+            return True
+        decision = self.admission.check(command, chat_id, user_id)
+        self.metrics.admission_decisions.inc(command.name, decision)
+        if decision == ADMIT:
+            return True
+        logger.debug("[Apilot] command %s from %s rejected: %s", command.name, chat_id, decision)
+        if decision == SHED:
+            e_context["reply"] = self.create_reply(ReplyType.TEXT, self.admission.shed_reply)
+        return False
+
+    def sender_ids(self, context):
+        """返回 (会话 id, 发送者 id)，私聊时两者相同"""
+        chat_id = context.get("receiver") or context.get("session_id")
+        msg = context.get("msg")
+        if msg is None:
+            return chat_id, chat_id
+        user_id = msg.actual_user_id if context.get("isgroup", False) else msg.from_user_id
+        return chat_id, user_id or chat_id
+
+    def run_command(self, command, handler):
+        """执行指令并记录耗时和异常"""
+        with self.metrics.command_latency.time(command.name):
+            try:
+                return handler(*command.args)
+            except Exception as e:
+                self.metrics.command_errors.inc(command.name, type(e).__name__)
+                raise
 
-        if content.startswith("快递"):
-            # Extract the part after "快递"
-            tracking_number = content[2:].strip()
+    def run_async(self, command, handler, e_context):
+        """在线程池中执行指令
 
-            tracking_number = tracking_number.replace('：', ':')  # 替换可能出现的中文符号
-            # Check if alapi_token is available before calling the function
-            if not self.alapi_token:
-                self.handle_error("alapi_token not configured", "快递请求失败")
-                reply = self.create_reply(ReplyType.TEXT, "请先配置alapi的token")
-            else:
-                # Check if the tracking_number starts with "SF" for Shunfeng (顺丰) Express
-                if tracking_number.startswith("SF"):
-                    # Check if the user has included the last four digits of the phone number
-                    if ':' not in tracking_number:
-                        reply = self.create_reply(ReplyType.TEXT, "顺丰快递需要补充寄/收件人手机号后四位，格式：SF12345:0000")
-                        e_context["reply"] = reply
-                        e_context.action = EventAction.BREAK_PASS  # 事件结束，并跳过处理context的默认逻辑
-                        return  # End the function here
-
-                # Call query_express_info function with the extracted tracking_number and the alapi_token from config
-                content = self.query_express_info(self.alapi_token, tracking_number)
-                reply = self.create_reply(ReplyType.TEXT, content)
-            e_context["reply"] = reply
-            e_context.action = EventAction.BREAK_PASS  # 事件结束，并跳过处理context的默认逻辑
+        sync_wait 秒内完成的指令照常通过 e_context 回复；否则先回复占位提示(如有配置)，
+        完成后再通过 channel 发送结果，超过截止时间仍未完成则发送超时提示。
+        """
+        future = self.executor.submit(self.run_command, command, handler)
+        if future is None:
+            e_context["reply"] = self.create_reply(ReplyType.TEXT, "当前查询的人太多啦，请稍后再试")
             return
-
-        horoscope_match = re.match(r'^([\u4e00-\u9fa5]{2}座)$', content)
-        if horoscope_match:
-            if content in ZODIAC_MAPPING:
-                zodiac_english = ZODIAC_MAPPING[content]
-                content = self.get_horoscope(self.alapi_token, zodiac_english)
-                reply = self.create_reply(ReplyType.TEXT, content)
-            else:
-                reply = self.create_reply(ReplyType.TEXT, "请重新输入星座名称")
-            e_context["reply"] = reply
-            e_context.action = EventAction.BREAK_PASS  # 事件结束，并跳过处理context的默认逻辑
+        try:
+            e_context["reply"] = future.result(timeout=self.sync_wait)
             return
-
-        hot_trend_match = re.search(r'(.{1,6})热榜$', content)
-        if hot_trend_match:
-            hot_trends_type = hot_trend_match.group(1).strip()  # 提取匹配的组并去掉可能的空格
-            content = self.get_hot_trends(hot_trends_type)
-            reply = self.create_reply(ReplyType.TEXT, content)
-            e_context["reply"] = reply
-            e_context.action = EventAction.BREAK_PASS  # 事件结束，并跳过处理context的默认逻辑
+        except FutureTimeoutError:
+            pass
+        except Exception as e:
+            e_context["reply"] = self.create_reply(ReplyType.TEXT, self.handle_error(e, "出错啦，稍后再试"))
             return
 
-        # 查字典功能
-        word_match = re.match(r'^查字典\s+(.+)$', content)
-        if word_match:
-            word = word_match.group(1)
-            if not self.alapi_token:
-                self.handle_error("alapi_token not configured", "查字典功能失败")
-                reply = self.create_reply(ReplyType.TEXT, "请先配置alapi的token")
-            else:
-                word_info = self.get_word_info(self.alapi_token, word)
-                reply = self.create_reply(ReplyType.TEXT, word_info)
-            e_context["reply"] = reply
-            e_context.action = EventAction.BREAK_PASS  # 事件结束，并跳过处理context的默认逻辑
-            return
+        channel = e_context["channel"]
+        context = e_context["context"]
 
-        # 黄金价格查询
-        if content == "黄金":
-            if not self.alapi_token:
-                self.handle_error("alapi_token not configured", "黄金价格查询失败")
-                reply = self.create_reply(ReplyType.TEXT, "请先配置alapi的token")
-            else:
-                gold_price = self.get_gold_price(self.alapi_token)
-                reply = self.create_reply(ReplyType.TEXT, gold_price)
-            e_context["reply"] = reply
-            e_context.action = EventAction.BREAK_PASS  # 事件结束，并跳过处理context的默认逻辑
-            return
+        def on_done(f):
+            try:
+                reply = f.result()
+            except Exception as e:
+                reply = self.create_reply(ReplyType.TEXT, self.handle_error(e, "出错啦，稍后再试"))
+            channel.send(reply, context)
+
+        def on_timeout():
+            logger.warn(f"[Apilot] command {command.name} missed its deadline")
+            channel.send(self.create_reply(ReplyType.TEXT, "查询超时，请稍后再试"), context)
+
+        deadline = self.command_deadlines.get(command.name, self.command_deadline)
+        self.executor.run_deferred(future, max(0, deadline - self.sync_wait), on_done, on_timeout)
+        if self.placeholder_text:
+            e_context["reply"] = self.create_reply(ReplyType.TEXT, self.placeholder_text)
+
+    def image_reply(self, result):
+        # 检查结果是否为本地文件路径（图片生成或下载的结果）
+        if result and os.path.isfile(result):
+            return self.create_reply(ReplyType.IMAGE_PATH, result)
+        # 如果不是本地文件，检查是否为有效URL
+        reply_type = ReplyType.IMAGE_URL if self.is_valid_url(result) else ReplyType.TEXT
+        return self.create_reply(reply_type, result)
+
+    def is_admin(self, context):
+        msg = context.get("msg")
+        if msg is None:
+            return False
+        # 群聊中只认发言人本人，不认群
+        if context.get("isgroup", False):
+            identities = {msg.actual_user_id, msg.actual_user_nickname}
+        else:
+            identities = {msg.from_user_id, msg.from_user_nickname}
+        return bool(identities & self.admin_users)
+
+    def handle_metrics(self, context):
+        if not self.is_admin(context):
+            return self.create_reply(ReplyType.TEXT, "仅管理员可用")
+        summary = self.metrics.summary()
+        if self.token_pool:
+            lines = ["\nALAPI token(今日调用 / 限额)："]
+            for fingerprint, used, quota, paused in self.token_pool.status():
+                lines.append(f"  {fingerprint}: {used} / {quota or '不限'}" + (f"，暂停 {paused:.0f}s" if paused else ""))
+            summary += "\n".join(lines)
+        return self.create_reply(ReplyType.TEXT, summary)
+
+    def token_missing_reply(self, message):
+        self.handle_error("alapi_token not configured", message)
+        return self.create_reply(ReplyType.TEXT, "请先配置alapi的token")
+
+    def handle_morning_news(self):
+        return self.image_reply(self.get_morning_news(self.alapi_token, self.morning_news_text_enabled))
+
+    def handle_moyu(self):
+        return self.image_reply(self.get_moyu_calendar())
+
+    def handle_moyu_video(self):
+        moyu = self.get_moyu_calendar_video()
+        reply_type = ReplyType.VIDEO_URL if self.is_valid_url(moyu) else ReplyType.TEXT
+        return self.create_reply(reply_type, moyu)
+
+    def handle_bagua(self):
+        return self.image_reply(self.get_mx_bagua())
+
+    def handle_express(self, tracking_number):
+        tracking_number = tracking_number.replace('：', ':')  # 替换可能出现的中文符号
+        # Check if alapi_token is available before calling the function
+        if not self.alapi_token:
+            return self.token_missing_reply("快递请求失败")
+        # Check if the tracking_number starts with "SF" for Shunfeng (顺丰) Express
+        if tracking_number.startswith("SF") and ':' not in tracking_number:
+            # Check if the user has included the last four digits of the phone number
+            return self.create_reply(ReplyType.TEXT, "顺丰快递需要补充寄/收件人手机号后四位，格式：SF12345:0000")
+        # Call query_express_info function with the extracted tracking_number and the alapi_token from config
+        content = self.query_express_info(self.alapi_token, tracking_number)
+        return self.create_reply(ReplyType.TEXT, content)
+
+    def handle_express_subscribe(self, context, tracking_number):
+        tracking_number = tracking_number.replace('：', ':')
+        if not self.alapi_token:
+            return self.token_missing_reply("快递订阅失败")
+        if tracking_number.startswith("SF") and ':' not in tracking_number:
+            return self.create_reply(ReplyType.TEXT, "顺丰快递需要补充寄/收件人手机号后四位，格式：订阅快递SF12345:0000")
+        response_json = self.fetch_express(self.alapi_token, tracking_number)
+        if not isinstance(response_json, dict) or response_json.get("code") != 200 or not response_json.get("data"):
+            msg = response_json.get("msg", "未知错误") if isinstance(response_json, dict) else "api响应为空"
+            return self.create_reply(ReplyType.TEXT, f"订阅失败，{msg}")
+        data = response_json["data"]
+        content = self.format_express(data)
+        if int(data.get("status") or 0) in FINAL_STATUSES:
+            return self.create_reply(ReplyType.TEXT, f"{content}\n\n快递已结束，无需订阅")
+        receiver = context["receiver"]
+        self._push_contexts[receiver] = context
+        subscriber = {"receiver": receiver, "isgroup": context.get("isgroup", False)}
+        tips = self.express_tracker.subscribe(tracking_number, subscriber, data)
+        return self.create_reply(ReplyType.TEXT, f"{content}\n\n{tips}")
+
+    def handle_express_unsubscribe(self, context, tracking_number):
+        tracking_number = tracking_number.replace('：', ':')
+        if self.express_tracker.unsubscribe(tracking_number, context["receiver"]):
+            return self.create_reply(ReplyType.TEXT, f"已取消订阅快递 {tracking_number}")
+        return self.create_reply(ReplyType.TEXT, f"没有订阅快递 {tracking_number}")
+
+    def handle_express_list(self, context):
+        subscriptions = self.express_tracker.subscriptions(context["receiver"])
+        if not subscriptions:
+            return self.create_reply(ReplyType.TEXT, "当前没有订阅的快递，发送“订阅快递+单号”即可订阅")
+        lines = ["📦 已订阅的快递："]
+        for number, item in subscriptions:
+            lines.append(f"{number}：{item['status_desc'] or '暂无状态'}")
+        return self.create_reply(ReplyType.TEXT, "\n".join(lines))
+
+    def poll_express(self, tracking_number):
+        """快递订阅轮询使用，返回接口的 data，失败时返回 None"""
+        response_json = self.fetch_express(self.alapi_token, tracking_number)
+        if isinstance(response_json, dict) and response_json.get("code") == 200:
+            return response_json.get("data")
+        return None
 
-        # 油价查询
-        oil_match = re.match(r'^(.{2,7}?)(?:省|市)?油价$', content)
-        if oil_match:
-            province = oil_match.group(1)
-            if not self.alapi_token:
-                self.handle_error("alapi_token not configured", "油价查询失败")
-                reply = self.create_reply(ReplyType.TEXT, "请先配置alapi的token")
-            else:
-                oil_price = self.get_oil_price(self.alapi_token, province)
-                reply = self.create_reply(ReplyType.TEXT, oil_price)
-            e_context["reply"] = reply
-            e_context.action = EventAction.BREAK_PASS  # 事件结束，并跳过处理context的默认逻辑
-            return            
-
-        # 天气查询
-        weather_match = re.match(r'^(?:(.{2,7}?)(?:市|县|区|镇)?|(\d{7,9}))(:?今天|明天|后天|7天|七天)?(?:的)?天气$', content)
-        if weather_match:
-            city_or_id = weather_match.group(1) or weather_match.group(2)
-            date = weather_match.group(3)
-            if not self.alapi_token:
-                self.handle_error("alapi_token not configured", "天气请求失败")
-                reply = self.create_reply(ReplyType.TEXT, "请先配置alapi的token")
-            else:
-                content = self.get_weather(self.alapi_token, city_or_id, date, content)
-                reply = self.create_reply(ReplyType.TEXT, content)
-            e_context["reply"] = reply
-            e_context.action = EventAction.BREAK_PASS  # 事件结束，并跳过处理context的默认逻辑
-            return
+    def push_express_update(self, subscriber, text):
+        if self.push_channel is None:
+            raise RuntimeError("no channel available for push")
+        context = self._push_contexts.get(subscriber["receiver"])
+        if context is None:
+            # 重启前的订阅没有原始消息上下文，按会话重新构造
+            context = Context(ContextType.TEXT, "", kwargs={"receiver": subscriber["receiver"],
+                                                            "isgroup": subscriber.get("isgroup", False)})
+        self.push_channel.send(self.create_reply(ReplyType.TEXT, text), context)
+
+    def handle_horoscope(self, sign):
+        if sign not in ZODIAC_MAPPING:
+            return self.create_reply(ReplyType.TEXT, "请重新输入星座名称")
+        content = self.cached_horoscope(ZODIAC_MAPPING[sign])
+        if content is not None:
+            self.metrics.cache_requests.inc("horoscope", "hit")
+        else:
+            self.metrics.cache_requests.inc("horoscope", "miss")
+            content = self.get_horoscope(self.alapi_token, ZODIAC_MAPPING[sign])
+        return self.create_reply(ReplyType.TEXT, content)
+
+    def handle_hot_trends(self, hot_trends_type):
+        return self.create_reply(ReplyType.TEXT, self.get_hot_trends(hot_trends_type))
+
+    def handle_hot_trends_all(self):
+        return self.create_reply(ReplyType.TEXT, self.get_all_hot_trends())
+
+    def handle_word(self, word):
+        # 本地字典可以不依赖 token，只有需要请求接口时才提示配置 token
+        if not self.alapi_token and self.load_word_index() is None:
+            return self.token_missing_reply("查字典功能失败")
+        return self.create_reply(ReplyType.TEXT, self.get_word_info(self.alapi_token, word))
+
+    def handle_gold(self):
+        if not self.alapi_token:
+            return self.token_missing_reply("黄金价格查询失败")
+        return self.create_reply(ReplyType.TEXT, self.get_gold_price(self.alapi_token))
+
+    def handle_oil(self, province):
+        if not self.alapi_token:
+            return self.token_missing_reply("油价查询失败")
+        return self.create_reply(ReplyType.TEXT, self.get_oil_price(self.alapi_token, province))
+
+    def handle_weather(self, city_or_id, date, content):
+        if not self.alapi_token:
+            return self.token_missing_reply("天气请求失败")
+        return self.create_reply(ReplyType.TEXT, self.get_weather(self.alapi_token, city_or_id, date, content))
+
+    def handle_weather_batch(self, cities, date):
+        if not self.alapi_token:
+            return self.token_missing_reply("天气请求失败")
+        return self.create_reply(ReplyType.TEXT, self.get_weather_batch(self.alapi_token, cities, date))
 
     def get_help_text(self, verbose=False, **kwargs):
         short_help_text = " 发送特定指令以获取早报、热榜、查询天气、星座运势、快递信息等！"
@@ -214,53 +493,56 @@ class Apilot(Plugin):
 
         # 娱乐和信息类
         help_text += "\n🎉 娱乐与资讯：\n"
-        help_text += "  🌅 早报: 发送"早报"获取早报。\n"
-        help_text += "  🌴 摸鱼: 发送"摸鱼"获取摸鱼人日历。\n"
-        help_text += "  🔥 热榜: 发送"xx热榜"查看支持的热榜。\n"
-        help_text += "  🔥 八卦: 发送"八卦"获取明星八卦。\n"
+        help_text += "  🌅 早报: 发送“早报”获取早报。\n"
+        help_text += "  🌴 摸鱼: 发送“摸鱼”获取摸鱼人日历。\n"
+        help_text += "  🔥 热榜: 发送“xx热榜”查看支持的热榜。\n"
+        help_text += "  🔥 八卦: 发送“八卦”获取明星八卦。\n"
 
         # 查询类
         help_text += "\n🔍 查询工具：\n"
-        help_text += "  🌤️ 天气: 发送"城市+天气"查天气，如"北京天气"。\n"
-        help_text += "  📦 快递: 发送"快递+单号"查询快递状态。如"快递112345655"\n"
-        help_text += "  🌌 星座: 发送星座名称查看今日运势，如"白羊座"。\n"
+        help_text += "  🌤️ 天气: 发送“城市+天气”查天气，如“北京天气”。\n"
+        help_text += "  📦 快递: 发送“快递+单号”查询快递状态。如“快递112345655”\n"
+        help_text += "  🌌 星座: 发送星座名称查看今日运势，如“白羊座”。\n"
 
         return help_text
 
     def get_morning_news(self, alapi_token, morning_news_text_enabled):
+        news = self.fetch_morning_news(alapi_token)
+        if not isinstance(news, dict):
+            return news
+        return self.render_morning_news(news)
+
+    def fetch_morning_news(self, alapi_token):
+        """获取早报内容
+
+        Returns:
+            dict: 包含 date、title、text、img_url 的早报信息；获取失败时返回错误提示文本
+        """
         if not alapi_token:
-            url = BASE_URL_VVHAN + "60s?type=json"
+            url = self.base_url_vvhan + "60s?type=json"
             payload = "format=json"
             headers = {'Content-Type': "application/x-www-form-urlencoded"}
             try:
                 morning_news_info = self.make_request(url, method="POST", headers=headers, data=payload)
-                if isinstance(morning_news_info, dict) and morning_news_info['success']:
-                    # 提取并格式化新闻
-                    news_list = ["{}. {}".format(idx, news) for idx, news in enumerate(morning_news_info["data"][:-1], 1)]
-                    title = f"☕ {morning_news_info['data']['date']}  今日早报"
+                if isinstance(morning_news_info, dict) and morning_news_info.get('success'):
+                    # data 为新闻列表，最后一条是微语；日期在顶层的 time 字段
+                    items = morning_news_info["data"]
+                    news_list = ["{}. {}".format(idx, news) for idx, news in enumerate(items[:-1], 1)]
+                    date = str(morning_news_info.get('time') or morning_news_info.get('date') or "")[:10]
                     formatted_news = "\n".join(news_list)
-                    weiyu = morning_news_info["data"][-1].strip()
-                    full_text = f"{formatted_news}\n\n{weiyu}"
-                    
-                    # 转换为图片
-                    img_path = self.text_to_image(full_text, title=title)
-                    if img_path:
-                        return img_path
-                    else:
-                        # 如果转换失败，尝试从API获取的图片URL下载图片
-                        img_url = morning_news_info.get('imgUrl', '')
-                        if img_url and self.is_valid_image_url(img_url):
-                            downloaded_img = self.download_image(img_url)
-                            if downloaded_img:
-                                return downloaded_img
-                        # 如果下载也失败，最后才返回图片URL
-                        return img_url
+                    weiyu = items[-1].strip()
+                    return {
+                        "date": date,
+                        "title": f"☕ {date}  今日早报",
+                        "text": f"{formatted_news}\n\n{weiyu}",
+                        "img_url": morning_news_info.get('imgUrl', ''),
+                    }
                 else:
                     return self.handle_error(morning_news_info, '早报信息获取失败，可配置"alapi token"切换至 Alapi 服务，或者稍后再试')
             except Exception as e:
                 return self.handle_error(e, "出错啦，稍后再试")
         else:
-            url = BASE_URL_ALAPI + "zaobao"
+            url = self.base_url_alapi + "zaobao"
             data = {
                 "token": alapi_token,
                 "format": "json"
@@ -269,74 +551,102 @@ class Apilot(Plugin):
             try:
                 morning_news_info = self.make_request(url, method="POST", headers=headers, data=data)
                 if isinstance(morning_news_info, dict) and morning_news_info.get('code') == 200:
-                    img_url = morning_news_info['data']['image']
-                    
                     # 整理新闻为有序列表
                     news_list = morning_news_info['data']['news']
-                    title = f"☕ {morning_news_info['data']['date']}  今日早报"
+                    date = morning_news_info['data']['date']
                     formatted_news = "\n".join([f"{i+1}. {news}" for i, news in enumerate(news_list)])
                     weiyu = morning_news_info['data']['weiyu']
-                    full_text = f"{formatted_news}\n\n{weiyu}"
-                    
-                    # 转换为图片
-                    img_path = self.text_to_image(full_text, title=title)
-                    if img_path:
-                        return img_path
-                    else:
-                        # 如果文本转图片失败，尝试下载API提供的图片URL
-                        if img_url and self.is_valid_image_url(img_url):
-                            downloaded_img = self.download_image(img_url)
-                            if downloaded_img:
-                                return downloaded_img
-                        # 如果下载也失败，最后才返回图片URL
-                        return img_url
+                    return {
+                        "date": date,
+                        "title": f"☕ {date}  今日早报",
+                        "text": f"{formatted_news}\n\n{weiyu}",
+                        "img_url": morning_news_info['data']['image'],
+                    }
                 else:
                     return self.handle_error(morning_news_info, "早报获取失败，请检查 token 是否有误")
             except Exception as e:
                 return self.handle_error(e, "早报获取失败")
 
+    def render_morning_news(self, news):
+        """将早报渲染为图片，同一天的早报只渲染一次
+
+        Args:
+            news: fetch_morning_news 返回的早报信息
+
+        Returns:
+            str: 本地图片路径；渲染和下载都失败时返回图片URL
+        """
+        # 持锁渲染，同时到达的请求等待第一次渲染的结果
+        with self._morning_news_lock:
+            rendered = self._morning_news_render
+            if rendered and rendered[0] == news["date"] and os.path.isfile(rendered[1]):
+                return rendered[1]
+
+            # 转换为图片
+            img_path = self.text_to_image(news["text"], title=news["title"])
+            if img_path:
+                self._morning_news_render = (news["date"], img_path)
+                return img_path
+
+        # 如果文本转图片失败，尝试下载API提供的图片URL
+        img_url = news["img_url"]
+        if img_url:
+            downloaded_img = self.download_image(img_url)
+            if downloaded_img:
+                return downloaded_img
+        # 如果下载也失败，最后才返回图片URL
+        return img_url
+
+    def prerender_morning_news(self):
+        """定时任务：上游发布当天早报后提前渲染，返回 True 表示已完成"""
+        news = self.fetch_morning_news(self.alapi_token)
+        if not isinstance(news, dict) or str(news["date"])[:10] != datetime.now().strftime("%Y-%m-%d"):
+            return False
+        img_path = self.render_morning_news(news)
+        logger.info(f"[Apilot] morning news for {news['date']} pre-rendered: {img_path}")
+        return True
+
     def get_moyu_calendar(self):
-        url = BASE_URL_VVHAN + "moyu?type=json"
+        url = self.base_url_vvhan + "moyu?type=json"
         payload = "format=json"
         headers = {'Content-Type': "application/x-www-form-urlencoded"}
         moyu_calendar_info = self.make_request(url, method="POST", headers=headers, data=payload)
         # 验证请求是否成功
-        if isinstance(moyu_calendar_info, dict) and moyu_calendar_info['success']:
+        if isinstance(moyu_calendar_info, dict) and moyu_calendar_info.get('success'):
             moyu_pic_url = moyu_calendar_info['url']
-            if self.is_valid_image_url(moyu_pic_url):
-                # 尝试下载图片
-                downloaded_img = self.download_image(moyu_pic_url)
-                if downloaded_img:
-                    return downloaded_img
+            # 尝试下载图片，下载时同时校验链接是否为有效图片
+            downloaded_img = self.download_image(moyu_pic_url)
+            if downloaded_img:
+                return downloaded_img
             # 如果下载失败或URL无效，返回URL
             return moyu_pic_url
         else:
-            url = "https://dayu.qqsuu.cn/moyuribao/apis.php?type=json"
+            url = self.base_url_dayu + "moyuribao/apis.php?type=json"
             payload = "format=json"
             headers = {'Content-Type': "application/x-www-form-urlencoded"}
             moyu_calendar_info = self.make_request(url, method="POST", headers=headers, data=payload)
-            if isinstance(moyu_calendar_info, dict) and moyu_calendar_info['code'] == 200:
+            if isinstance(moyu_calendar_info, dict) and moyu_calendar_info.get('code') == 200:
                 moyu_pic_url = moyu_calendar_info['data']
+                # 尝试下载图片
+                downloaded_img = self.download_image(moyu_pic_url)
+                if downloaded_img:
+                    return downloaded_img
                 if self.is_valid_image_url(moyu_pic_url):
-                    # 尝试下载图片
-                    downloaded_img = self.download_image(moyu_pic_url)
-                    if downloaded_img:
-                        return downloaded_img
                     # 如果下载失败，返回URL
                     return moyu_pic_url
                 else:
                     return "周末无需摸鱼，愉快玩耍吧"
             else:
-                return "暂无可用"摸鱼"服务，认真上班"
+                return "暂无可用“摸鱼”服务，认真上班"
 
     def get_moyu_calendar_video(self):
-        url = "https://dayu.qqsuu.cn/moyuribaoshipin/apis.php?type=json"
+        url = self.base_url_dayu + "moyuribaoshipin/apis.php?type=json"
         payload = "format=json"
         headers = {'Content-Type': "application/x-www-form-urlencoded"}
         moyu_calendar_info = self.make_request(url, method="POST", headers=headers, data=payload)
-        logger.debug(f"[Apilot] moyu calendar video response: {moyu_calendar_info}")
+        logger.debug("[Apilot] moyu calendar video response: %s", moyu_calendar_info)
         # 验证请求是否成功
-        if isinstance(moyu_calendar_info, dict) and moyu_calendar_info['code'] == 200:
+        if isinstance(moyu_calendar_info, dict) and moyu_calendar_info.get('code') == 200:
             moyu_video_url = moyu_calendar_info['data']
             if self.is_valid_image_url(moyu_video_url):
                 return moyu_video_url
@@ -345,15 +655,57 @@ class Apilot(Plugin):
         return "视频版没了，看看文字版吧"
 
     def get_horoscope(self, alapi_token, astro_sign: str, time_period: str = "today"):
+        content, ok = self.fetch_horoscope(alapi_token, astro_sign, time_period)
+        if ok and time_period == "today":
+            self.store_horoscope(astro_sign, content)
+        return content
+
+    def cached_horoscope(self, astro_sign):
+        date, horoscopes = self._horoscopes
+        if date != datetime.now().strftime("%Y-%m-%d"):
+            return None
+        return horoscopes.get(astro_sign)
+
+    def store_horoscope(self, astro_sign, content):
+        today = datetime.now().strftime("%Y-%m-%d")
+        with self._horoscope_lock:
+            date, horoscopes = self._horoscopes
+            if date != today:
+                horoscopes = {}
+                self._horoscopes = (today, horoscopes)
+            horoscopes[astro_sign] = content
+
+    def prefetch_horoscopes(self):
+        """定时任务：每天一次性获取十二星座当天的运势并格式化，返回 True 表示全部完成
+
+        与预渲染早报一样核对数据日期，上游还没更新到今天的星座不保存，返回 False 由调度器稍后重试。
+        """
+        missing = [sign for sign in ZODIAC_MAPPING.values() if self.cached_horoscope(sign) is None]
+        tasks = {sign: partial(self.fetch_horoscope, self.alapi_token, sign) for sign in missing}
+        # 使用独立的小线程池限制并发，不占用指令的 fan-out 线程
+        with ThreadPoolExecutor(max_workers=self.horoscope_prefetch_concurrency,
+                                thread_name_prefix="apilot-horoscope") as pool:
+            results, errors, timed_out = fan_out(pool, tasks, HOROSCOPE_PREFETCH_TIMEOUT)
+        fetched = 0
+        for sign, (content, ok) in results.items():
+            if ok:
+                self.store_horoscope(sign, content)
+                fetched += 1
+        logger.info(f"[Apilot] horoscopes prefetched: {fetched}/{len(missing)}, "
+                    f"errors {len(errors)}, timed out {len(timed_out)}")
+        return fetched == len(missing)
+
+    def fetch_horoscope(self, alapi_token, astro_sign: str, time_period: str = "today"):
+        """请求并格式化星座运势，返回 (回复文本, 是否为上游今天的最新数据)"""
         if not alapi_token:
-            url = BASE_URL_VVHAN + "horoscope"
+            url = self.base_url_vvhan + "horoscope"
             params = {
                 'type': astro_sign,
                 'time': time_period
             }
             try:
                 horoscope_data = self.make_request(url, "GET", params=params)
-                if isinstance(horoscope_data, dict) and horoscope_data['success']:
+                if isinstance(horoscope_data, dict) and horoscope_data.get('success'):
                     data = horoscope_data['data']
 
                     result = (
@@ -377,16 +729,17 @@ class Apilot(Plugin):
                         f"健康：{data['fortunetext']['health']}\n"
                     )
 
-                    return result
+                    note = self.stale_note(horoscope_data)
+                    return result + note, not note and self.is_published_today(horoscope_data)
 
                 else:
-                    return self.handle_error(horoscope_data, '星座信息获取失败，可配置"alapi token"切换至 Alapi 服务，或者稍后再试')
+                    return self.handle_error(horoscope_data, '星座信息获取失败，可配置"alapi token"切换至 Alapi 服务，或者稍后再试'), False
 
             except Exception as e:
-                return self.handle_error(e, "出错啦，稍后再试")
+                return self.handle_error(e, "出错啦，稍后再试"), False
         else:
             # 使用 ALAPI 的 URL 和提供的 token
-            url = BASE_URL_ALAPI + "star"
+            url = self.base_url_alapi + "star"
             payload = f"token={alapi_token}&star={astro_sign}"
             headers = {'Content-Type': "application/x-www-form-urlencoded"}
             try:
@@ -414,22 +767,26 @@ class Apilot(Plugin):
                         f"财运：{data['money_text']}\n"
                         f"健康：{data['health_text']}\n"
                     )
-                    return result
+                    note = self.stale_note(horoscope_data)
+                    return result + note, not note and self.is_published_today(horoscope_data)
                 else:
-                    return self.handle_error(horoscope_data, "星座获取信息获取失败，请检查 token 是否有误")
+                    return self.handle_error(horoscope_data, "星座获取信息获取失败，请检查 token 是否有误"), False
             except Exception as e:
-                return self.handle_error(e, "出错啦，稍后再试")
+                return self.handle_error(e, "出错啦，稍后再试"), False
+
+    @staticmethod
+    def is_published_today(payload):
+        """按天更新的数据是否已是今天的，上游还没更新时返回 False；数据中没有日期时视为是"""
+        date = payload_date(payload)
+        return date is None or date == datetime.now().strftime("%Y-%m-%d")
 
     def get_hot_trends(self, hot_trends_type):
         # 查找映射字典以获取API参数
         hot_trends_type_en = hot_trend_types.get(hot_trends_type, None)
         if hot_trends_type_en is not None:
-            url = BASE_URL_VVHAN + "hotlist/" + hot_trends_type_en
             try:
-                data = self.make_request(url, "GET", {
-                    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-                })
-                if isinstance(data, dict) and data['success'] == True:
+                data = self.fetch_hot_trends(hot_trends_type_en)
+                if isinstance(data, dict) and data.get('success') == True:
                     output = []
                     topics = data['data']
                     output.append(f'更新时间：{data["update_time"]}\n')
@@ -437,7 +794,7 @@ class Apilot(Plugin):
                         hot = topic.get('hot', '无热度参数, 0')
                         formatted_str = f"{i}. {topic['title']} ({hot} 浏览)\nURL: {topic['url']}\n"
                         output.append(formatted_str)
-                    return "\n".join(output)
+                    return "\n".join(output) + self.stale_note(data)
                 else:
                     return self.handle_error(data, "热榜获取失败，请稍后再试")
             except Exception as e:
@@ -450,13 +807,78 @@ class Apilot(Plugin):
             )
             return final_output
 
-    def query_express_info(self, alapi_token, tracking_number, com="", order="asc"):
-        url = BASE_URL_ALAPI + "kd"
+    def fetch_hot_trends(self, hot_trends_type_en, timeout=None):
+        url = self.base_url_vvhan + "hotlist/" + hot_trends_type_en
+        return self.make_request(url, "GET", {
+            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+        }, timeout=timeout)
+
+    def get_all_hot_trends(self):
+        """并发获取所有(或配置的)热榜平台，合并去重后返回前 N 条
+
+        每个平台单独设置超时，慢的平台直接丢弃，不拖慢整体回复。
+        """
+        sources = [name for name in self.hot_trends_all_sources if name in hot_trend_types]
+        tasks = {name: partial(self.fetch_hot_trends, hot_trend_types[name], timeout=self.hot_trends_source_timeout)
+                 for name in sources}
+        results, errors, timed_out = fan_out(self.fanout_pool, tasks, self.hot_trends_source_timeout + 1)
+
+        merged = {}  # 归一化标题 -> [标题, URL, 平台列表, 最高排名]
+        succeeded, failed = [], []
+        for name in sources:
+            if name in timed_out:
+                continue
+            data = results.get(name)
+            if not isinstance(data, dict) or data.get('success') is not True or not data.get('data'):
+                failed.append(name)
+                continue
+            succeeded.append(name)
+            for rank, topic in enumerate(data.get('data', [])[:HOT_TRENDS_PER_SOURCE], 1):
+                title = topic.get('title', '').strip()
+                key = HOT_TITLE_NORMALIZE_RE.sub("", title).lower()
+                if not key:
+                    continue
+                entry = merged.get(key)
+                if entry is None:
+                    merged[key] = [title, topic.get('url', ''), [name], rank]
+                else:
+                    entry[2].append(name)
+                    entry[3] = min(entry[3], rank)
+        if not merged:
+            return self.handle_error(errors or timed_out, "热榜获取失败，请稍后再试")
+
+        # 多个平台同时上榜的话题排在前面，其次按最高排名
+        topics = sorted(merged.values(), key=lambda entry: (-len(entry[2]), entry[3]))[:self.hot_trends_all_top_n]
+        output = [f"🔥 全网热榜（{len(succeeded)}/{len(sources)} 个平台）\n"]
+        for i, (title, url, platforms, _) in enumerate(topics, 1):
+            output.append(f"{i}. {title} [{'/'.join(platforms)}]\nURL: {url}\n")
+        if failed:
+            output.append(f"以下平台获取失败，未计入：{'/'.join(failed)}")
+        if timed_out:
+            output.append(f"以下平台响应超时，未计入：{'/'.join(timed_out)}")
+        return "\n".join(output)
+
+    def fetch_express(self, alapi_token, tracking_number, com="", order="asc"):
+        url = self.base_url_alapi + "kd"
         payload = f"token={alapi_token}&number={tracking_number}&com={com}&order={order}"
         headers = {'Content-Type': "application/x-www-form-urlencoded"}
+        return self.make_request(url, method="POST", headers=headers, data=payload)
+
+    def format_express(self, data):
+        formatted_result = [
+            f"快递编号：{data.get('nu')}",
+            f"快递公司：{data.get('com')}",
+            f"状态：{data.get('status_desc')}",
+            "状态信息："
+        ]
+        for info in data.get("info") or []:
+            time_str = info.get('time')[5:-3]
+            formatted_result.append(f"{time_str} - {info.get('status_desc')}\n    {info.get('content')}")
+        return "\n".join(formatted_result)
 
+    def query_express_info(self, alapi_token, tracking_number, com="", order="asc"):
         try:
-            response_json = self.make_request(url, method="POST", headers=headers, data=payload)
+            response_json = self.fetch_express(alapi_token, tracking_number, com, order)
 
             if not isinstance(response_json, dict) or response_json is None:
                 return f"查询失败：api响应为空"
@@ -465,62 +887,116 @@ class Apilot(Plugin):
                 msg = response_json.get("msg", "未知错误")
                 self.handle_error(msg, f"错误码{code}")
                 return f"查询失败，{msg}"
-            data = response_json.get("data", None)
-            formatted_result = [
-                f"快递编号：{data.get('nu')}",
-                f"快递公司：{data.get('com')}",
-                f"状态：{data.get('status_desc')}",
-                "状态信息："
-            ]
-            for info in data.get("info"):
-                time_str = info.get('time')[5:-3]
-                formatted_result.append(f"{time_str} - {info.get('status_desc')}\n    {info.get('content')}")
-
-            return "\n".join(formatted_result)
+            return self.format_express(response_json.get("data", None))
 
         except Exception as e:
             return self.handle_error(e, "快递查询失败")
 
     def get_word_info(self, alapi_token, word):
-        url = BASE_URL_ALAPI + "word"
+        """查询汉字信息，多个字逐字查询后合并为一条回复
+
+        优先使用本地字典，本地没有的字合并为一次接口请求，接口的结果按字缓存。
+        """
+        chars = list(dict.fromkeys(CJK_CHAR_RE.findall(word)))
+        if not chars:
+            return "请输入要查询的汉字，如“查字典 你好”"
+        truncated = len(chars) > MAX_WORD_CHARS
+        chars = chars[:MAX_WORD_CHARS]
+        index = self.load_word_index()
+        found, missing = {}, []
+        for char in chars:
+            info = index.lookup(char) if index else None
+            if info is not None:
+                self.metrics.cache_requests.inc("word", "local")
+            else:
+                info = self.word_cache.get(char)
+                self.metrics.cache_requests.inc("word", "hit" if info is not None else "miss")
+            if info is None:
+                missing.append(char)
+            else:
+                found[char] = info
+
+        if missing and alapi_token:
+            # 先用一次请求查询所有缺少的字，接口没有返回的字再逐字并发查询
+            if len(missing) > 1:
+                batch = self.fetch_words(alapi_token, missing)
+                if isinstance(batch, dict):
+                    found.update(batch)
+                    missing = [char for char in missing if char not in batch]
+                else:
+                    logger.warn(f"[Apilot] Batch word lookup failed, falling back to single characters: {batch}")
+            tasks = {char: partial(self.fetch_word, alapi_token, char) for char in missing}
+            results, errors, timed_out = fan_out(self.fanout_pool, tasks, self.batch_deadline)
+            found.update(results)
+            for char, e in errors.items():
+                logger.error(f"[Apilot] Failed to fetch word info: {e}")
+                found[char] = f"查询 {char} 的字典信息失败，错误信息：{e}"
+            for char in timed_out:
+                found[char] = f"查询 {char} 的字典信息超时，请稍后再试"
+        else:
+            for char in missing:
+                found[char] = f"本地字典中没有 {char}，配置 alapi 的 token 后可查询"
+
+        sections = [self.format_word(found[char]) if isinstance(found[char], dict) else found[char] for char in chars]
+        if truncated:
+            sections.append(f"一次最多查询 {MAX_WORD_CHARS} 个字")
+        return "\n".join(sections)
+
+    def fetch_words(self, alapi_token, chars):
+        """用一次请求查询多个汉字
+
+        Returns:
+            dict: {字: 字典信息}，只包含接口返回了的字，查到的字按字缓存；请求失败时返回提示文本
+        """
+        url = self.base_url_alapi + "word"
         params = {
             "token": alapi_token,
-            "word": word
+            "word": "".join(chars)
         }
-        try:
-            response = requests.get(url, params=params)
-            response_json = response.json()
-            logger.debug(f"[Apilot] Word API response: {response_json}")
-            if response_json.get("success"):
-                data = response_json.get("data")
-                if data:
-                    word_info = data[0]  # 假设返回的第一个结果是我们需要的
-                    formatted_output = (
-                        f"字: {word_info['word']}\n"
-                        f"拼音: {word_info['pinyin']}\n"
-                        f"笔画: {word_info['strokes']}\n"
-                        f"部首: {word_info['radical']}\n"
-                        f"释义: {word_info['explanation']}\n"
-                    )
-                    return formatted_output
-                else:
-                    return f"未找到 {word} 的字典信息"
-            else:
-                error_message = response_json.get("message", "未知错误")
-                return f"查询字典信息失败，API 返回错误：{error_message}"
-        except Exception as e:
-            logger.error(f"[Apilot] Failed to fetch word info: {e}")
-            return f"查询字典信息失败，错误信息：{e}"
+        response_json = self.make_request(url, "GET", params=params)
+        if not isinstance(response_json, dict) or not response_json.get("success"):
+            error_message = response_json.get("message", "未知错误") if isinstance(response_json, dict) else response_json
+            return f"查询字典信息失败，API 返回错误：{error_message}"
+        found = {}
+        for word_info in response_json.get("data") or []:
+            char = word_info.get("word")
+            if char in chars and char not in found:
+                info = {field: word_info.get(field, "") for field in ("word", "pinyin", "strokes", "radical", "explanation")}
+                self.word_cache.set(char, info, WORD_CACHE_TTL)
+                found[char] = info
+        return found
+
+    def fetch_word(self, alapi_token, char):
+        """请求接口查询单个汉字
+
+        Returns:
+            dict: 字典信息；未找到或请求失败时返回提示文本，未找到的结果缓存 WORD_MISS_TTL
+        """
+        found = self.fetch_words(alapi_token, [char])
+        if not isinstance(found, dict):
+            return found
+        if char in found:
+            return found[char]
+        message = f"未找到 {char} 的字典信息"
+        self.word_cache.set(char, message, WORD_MISS_TTL)
+        return message
+
+    def format_word(self, word_info):
+        return (
+            f"字: {word_info['word']}\n"
+            f"拼音: {word_info['pinyin']}\n"
+            f"笔画: {word_info['strokes']}\n"
+            f"部首: {word_info['radical']}\n"
+            f"释义: {word_info['explanation']}\n"
+        )
 
     def get_gold_price(self, alapi_token):
-        url = BASE_URL_ALAPI + "gold"
+        url = self.base_url_alapi + "gold"
         params = {
             "token": alapi_token
         }
         try:
-            response = requests.get(url, params=params)
-            response_json = response.json()
-            logger.debug(f"[Apilot] Gold API response: {response_json}")
+            response_json = self.make_request(url, "GET", params=params)
             if response_json.get("success"):
                 data = response_json.get("data")
                 if data:
@@ -533,7 +1009,7 @@ class Apilot(Plugin):
                             f"最高价: {item['high_price']} 元\n"
                             f"最低价: {item['low_price']} 元\n"
                         )
-                    return "\n".join(formatted_output)
+                    return "\n".join(formatted_output) + self.stale_note(response_json)
                 else:
                     return "获取黄金价格失败，返回数据为空"
             else:
@@ -544,29 +1020,19 @@ class Apilot(Plugin):
             return f"获取黄金价格失败，错误信息：{e}"
 
     def get_oil_price(self, alapi_token, province):
-        url = BASE_URL_ALAPI + "oil"
+        url = self.base_url_alapi + "oil"
         params = {
             "token": alapi_token
         }
         try:
-            response = requests.get(url, params=params)
-            response_json = response.json()
-            logger.debug(f"[Apilot] Oil API response: {response_json}")
+            response_json = self.make_request(url, "GET", params=params)
             if response_json.get("success"):
                 data = response_json.get("data")
                 if data:
-                    for item in data:
-                        if item["province"] == province:
-                            formatted_output = (
-                                f"省份: {item['province']}\n"
-                                f"89号汽油: {item['o89']} 元/升\n"
-                                f"92号汽油: {item['o92']} 元/升\n"
-                                f"95号汽油: {item['o95']} 元/升\n"
-                                f"98号汽油: {item['o98']} 元/升\n"
-                                f"0号柴油: {item['o0']} 元/升\n"
-                            )
-                            return formatted_output
-                    return f"未找到 {province} 的油价信息"
+                    # 响应缓存过期前返回的是同一份数据，只在数据更新时重建索引
+                    if self._oil_table is None or self._oil_table[0] is not data:
+                        self._oil_table = (data, OilPriceTable(data))
+                    return self._oil_table[1].query(province) + self.stale_note(response_json)
                 else:
                     return "获取油价信息失败，返回数据为空"
             else:
@@ -574,42 +1040,46 @@ class Apilot(Plugin):
                 return f"获取油价信息失败，API 返回错误：{error_message}"
         except Exception as e:
             logger.error(f"[Apilot] Failed to fetch oil price: {e}")
-            return f"获取油价信息失败，错误信息：{e}"            
+            return f"获取油价信息失败，错误信息：{e}"
+
+    def fetch_weather(self, alapi_token, city_params, kind):
+        """获取实时天气(TODAY)或七天预报(SEVEN)，优先使用按城市缓存的数据，上游失败时返回过期的缓存"""
+        key = self.weather_cache.key_for(city_params)
+        cached = self.weather_cache.get(kind, key)
+        if cached is not None:
+            self.metrics.cache_requests.inc("weather", "hit")
+            return cached
+        self.metrics.cache_requests.inc("weather", "miss")
+        url = self.base_url_alapi + ('tianqi/seven' if kind == SEVEN else 'tianqi')
+        weather_data = self.make_request(url, "GET", params=dict(city_params, token=alapi_token))
+        if isinstance(weather_data, dict) and weather_data.get('success') is True and weather_data.get('data'):
+            self.weather_cache.put(kind, city_params, weather_data)
+            data = weather_data['data']
+            if 'city' in city_params and kind == TODAY and data.get('city_id'):
+                # 本地索引中没有的城市，记下接口返回的 city_id，之后按 id 请求
+                self.load_city_index().learn(city_params['city'], data['city_id'], data.get('province', ''))
+            return weather_data
+        fallback = self.weather_cache.get_fallback(kind, key)
+        if fallback is not None:
+            self.metrics.cache_requests.inc("weather", "fallback")
+            return fallback
+        return weather_data
 
     def get_weather(self, alapi_token, city_or_id: str, date: str, content):
-        url = BASE_URL_ALAPI + 'tianqi'
         isFuture = date in ['明天', '后天', '7天', '七天']
-        if isFuture:
-            url = BASE_URL_ALAPI + 'tianqi/seven'
-        # 判断使用id还是city请求api
-        if city_or_id.isnumeric():  # 判断是否为纯数字，也即是否为 city_id
-            params = {
-                'city_id': city_or_id,
-                'token': alapi_token
-            }
-        else:
-            city_info = self.check_multiple_city_ids(city_or_id)
-            if city_info:
-                data = city_info['data']
-                formatted_city_info = "\n".join(
-                    [f"{idx + 1}) {entry['province']}--{entry['leader']}, ID: {entry['city_id']}"
-                     for idx, entry in enumerate(data)]
-                )
-                return f"查询 <{city_or_id}> 具有多条数据：\n{formatted_city_info}\n请使用id查询，发送"id天气""
-
-            params = {
-                'city': city_or_id,
-                'token': alapi_token
-            }
+        # 尽量在本地解析出 city_id，按id请求api
+        city_params = self.resolve_city(city_or_id)
+        if isinstance(city_params, str):
+            return city_params
         try:
-            weather_data = self.make_request(url, "GET", params=params)
+            weather_data = self.fetch_weather(alapi_token, city_params, SEVEN if isFuture else TODAY)
             if not isinstance(weather_data, dict) or weather_data.get('success') is not True:
                 error_message = weather_data.get('message', '未知错误')
                 return self.handle_error(weather_data, f"获取天气信息失败，API 返回错误：{error_message}")
 
             data = weather_data.get('data')
             if data is None:
-                return "获取天气信息失败，返回数据为空。可能的原因：\n1. 查询的城市无效。\n2. 查询的日期格式不被支持（例如"七天"可能不被支持）。\n3. API 返回数据为空。"
+                return "获取天气信息失败，返回数据为空。可能的原因：\n1. 查询的城市无效。\n2. 查询的日期格式不被支持（例如“七天”可能不被支持）。\n3. API 返回数据为空。"
 
             # 处理天气数据
             if isFuture:
@@ -630,7 +1100,7 @@ class Apilot(Plugin):
                     for i in d['index']:
                         basic_info.append(f"{i['name']}: {i['level']}")
                     formatted_output.append("\n".join(basic_info) + '\n')
-                return "\n".join(formatted_output)
+                return "\n".join(formatted_output) + self.stale_note(weather_data)
 
             update_time = data['update_time']
             dt_object = datetime.strptime(update_time, "%Y-%m-%d %H:%M:%S")
@@ -656,12 +1126,10 @@ class Apilot(Plugin):
 
             # 未来 10 小时天气预报
             future_weather_info = "⏳ 未来 10 小时天气预报:\n"
-            current_time = datetime.strptime(data['update_time'], "%Y-%m-%d %H:%M:%S")
-            ten_hours_later = current_time + timedelta(hours=10)
-            for hour_data in data.get('hour', []):
-                forecast_time = datetime.strptime(hour_data['time'], "%Y-%m-%d %H:%M:%S")
-                if current_time <= forecast_time <= ten_hours_later:
-                    future_weather_info += f"  - {forecast_time.strftime('%H:%M')} - {hour_data['wea']} - {hour_data['temp']}℃\n"
+            ten_hours_later = dt_object + timedelta(hours=10)
+            for forecast_time, wea, temp in self.weather_cache.hours(data):
+                if dt_object <= forecast_time <= ten_hours_later:
+                    future_weather_info += f"  - {forecast_time.strftime('%H:%M')} - {wea} - {temp}℃\n"
             formatted_output.append(future_weather_info)
 
             # 空气质量详细信息
@@ -692,23 +1160,70 @@ class Apilot(Plugin):
                     )
                 formatted_output.append(alarm_info)
 
-            return "\n".join(formatted_output)
+            return "\n".join(formatted_output) + self.stale_note(weather_data)
         except Exception as e:
             return self.handle_error(e, "获取天气信息失败")
 
+    def get_weather_batch(self, alapi_token, cities, date):
+        """并发查询多个城市的天气，返回合并后的简要信息，部分城市失败时照常返回其余结果"""
+        cities = list(dict.fromkeys(cities))[:MAX_BATCH_CITIES]
+        kind = SEVEN if date in ['明天', '后天', '7天', '七天'] else TODAY
+        lines = {}
+        tasks = {}
+        for city in cities:
+            # 批量查询不按名称请求接口，索引中没有的城市需要单独查询
+            if not self.is_known_city(city):
+                lines[city] = f"❓ {city}: 未找到该城市，请单独查询"
+                continue
+            city_params = self.resolve_city(city)
+            if isinstance(city_params, str):
+                lines[city] = f"❓ {city}: 有同名城市或未找到该城市，请单独查询"
+                continue
+            tasks[city] = partial(self.fetch_weather, alapi_token, city_params, kind)
+
+        results, errors, timed_out = fan_out(self.fanout_pool, tasks, self.batch_deadline)
+        for city, weather_data in results.items():
+            if isinstance(weather_data, dict) and weather_data.get('success') is True and weather_data.get('data'):
+                try:
+                    lines[city] = self.format_weather_brief(weather_data['data'], date)
+                    continue
+                except (KeyError, IndexError, TypeError) as e:
+                    errors[city] = e
+            else:
+                errors[city] = weather_data
+        for city, error in errors.items():
+            self.handle_error(error, f"获取 {city} 天气信息失败")
+            lines[city] = f"❌ {city}: 获取天气信息失败"
+        for city in timed_out:
+            lines[city] = f"⏳ {city}: 查询超时"
+        return "\n".join(lines[city] for city in cities)
+
+    def format_weather_brief(self, data, date):
+        if date in ['明天', '后天']:
+            d = data[1 if date == '明天' else 2]
+            return (f"🏙️ {d['city']} {d['date']}: 🌤️{d['wea_day']} | 🌙{d['wea_night']}，"
+                    f"{d['temp_night']}~{d['temp_day']}℃")
+        if date in ['7天', '七天']:
+            output = [f"🏙️ {data[0]['city']}:"]
+            for d in data:
+                output.append(f"  {d['date'][5:]} {d['wea_day']}/{d['wea_night']} {d['temp_night']}~{d['temp_day']}℃")
+            return "\n".join(output)
+        return (f"🏙️ {data['city']}: {data['weather']} {data['min_temp']}~{data['max_temp']}℃"
+                f"(当前{data['temp']}℃)，{data['wind']}，空气{data['air']}")
+
     def get_mx_bagua(self):
-        url = "https://dayu.qqsuu.cn/mingxingbagua/apis.php?type=json"
+        url = self.base_url_dayu + "mingxingbagua/apis.php?type=json"
         payload = "format=json"
         headers = {'Content-Type': "application/x-www-form-urlencoded"}
         bagua_info = self.make_request(url, method="POST", headers=headers, data=payload)
         # 验证请求是否成功
-        if isinstance(bagua_info, dict) and bagua_info['code'] == 200:
+        if isinstance(bagua_info, dict) and bagua_info.get('code') == 200:
             bagua_pic_url = bagua_info["data"]
+            # 尝试下载图片
+            downloaded_img = self.download_image(bagua_pic_url)
+            if downloaded_img:
+                return downloaded_img
             if self.is_valid_image_url(bagua_pic_url):
-                # 尝试下载图片
-                downloaded_img = self.download_image(bagua_pic_url)
-                if downloaded_img:
-                    return downloaded_img
                 # 如果下载失败，返回URL
                 return bagua_pic_url
             else:
@@ -717,12 +1232,86 @@ class Apilot(Plugin):
             logger.error(f"错误信息：{bagua_info}")
             return "暂无明星八卦，吃瓜莫急"
 
-    def make_request(self, url, method="GET", headers=None, params=None, data=None, json_data=None):
+    def make_request(self, url, method="GET", headers=None, params=None, data=None, json_data=None, timeout=None):
+        cache_key = self.response_cache.make_key(method, url, params=params, data=data, json_data=json_data)
+        flight_key = cache_key or request_key(method, url, params, data, json_data)
+
+        def fetch():
+            # 排队期间前一个相同请求可能刚写入缓存
+            if cache_key:
+                cached = self.response_cache.get(cache_key)
+                if cached is not None:
+                    return cached
+            response_json = self._do_request(url, method, headers, params, data, json_data, timeout)
+            if not cache_key:
+                return response_json
+            if self.response_cache.is_cacheable(response_json):
+                self.response_cache.set(cache_key, url, response_json)
+                return response_json
+            # 上游失败或熔断时，返回上一次成功的数据
+            fallback = self.response_cache.get_fallback(cache_key)
+            if fallback is not None:
+                logger.warn(f"[Apilot] serving stale response for {cache_key}")
+                self.metrics.cache_requests.inc("response", "fallback")
+                return fallback
+            return response_json
+
+        if cache_key:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                logger.debug("[Apilot] cache hit: %s", cache_key)
+                self.metrics.cache_requests.inc("response", "hit")
+                return cached
+            # 刚过期的数据先返回，同时在后台刷新
+            cached = self.response_cache.get_revalidatable(cache_key)
+            if cached is not None:
+                self.metrics.cache_requests.inc("response", "stale")
+                if not self.request_flight.in_flight(flight_key):
+                    self.fanout_pool.submit(self.request_flight.do, flight_key, fetch)
+                return cached
+
+            self.metrics.cache_requests.inc("response", "miss")
+
+        # 相同的请求同时只发一次，其余调用方等待并共享结果
+        return self.request_flight.do(flight_key, fetch)
+
+    def stale_note(self, payload):
+        """数据是上游故障时的兜底缓存时，返回附加在回复末尾的提示"""
+        stale_since = payload.get(STALE_MARKER) if isinstance(payload, dict) else None
+        if not stale_since:
+            return ""
+        return f"\n⚠️ 服务暂时不可用，以上为 {datetime.fromtimestamp(stale_since).strftime('%m-%d %H:%M')} 前的缓存数据"
+
+    def _do_request(self, url, method, headers, params, data, json_data, timeout=None):
+        # timeout 为 None 时使用客户端的默认超时
+        options = {"timeout": timeout} if timeout else {}
+        token = None
+        if self.token_pool and url.startswith(self.base_url_alapi):
+            # 熔断中的请求不会发出，不占用 token 的频率和每日额度
+            if self.http.is_open(url):
+                return self._send_request(url, method, headers, params, data, json_data, options)
+            # 换成 token 池中余量最多的 token
+            try:
+                token = self.token_pool.acquire()
+            except NoTokenAvailableError as e:
+                logger.error(f"[Apilot] API request failed: {e}")
+                return {"success": False, "message": str(e)}
+            params, data = with_token(params, token), with_token(data, token)
+        response_json = self._send_request(url, method, headers, params, data, json_data, options)
+        if token:
+            if isinstance(response_json, dict) and response_json.get("error") in UNSENT_ERRORS:
+                # 请求没有真正发出(熔断或排队超时)，归还占用的 token
+                self.token_pool.release(token)
+            else:
+                self.token_pool.report(token, response_json)
+        return response_json
+
+    def _send_request(self, url, method, headers, params, data, json_data, options):
         try:
             if method.upper() == "GET":
-                response = requests.request(method, url, headers=headers, params=params)
+                response = self.http.request(method, url, headers=headers, params=params, **options)
             elif method.upper() == "POST":
-                response = requests.request(method, url, headers=headers, data=data, json=json_data)
+                response = self.http.request(method, url, headers=headers, data=data, json=json_data, **options)
             else:
                 return {"success": False, "message": "Unsupported HTTP method"}
 
@@ -734,7 +1323,7 @@ class Apilot(Plugin):
             try:
                 # 尝试解析 JSON 数据
                 response_json = response.json()
-                logger.debug(f"[Apilot] API response: {response_json}")
+                logger.debug("[Apilot] API response: %s", response_json)
                 return response_json
             except json.JSONDecodeError as e:
                 # 如果解析失败，记录完整的返回内容
@@ -742,7 +1331,7 @@ class Apilot(Plugin):
                 return {"success": False, "message": f"JSON Decode Error: {e}", "response_text": response.text}
         except requests.RequestException as e:
             logger.error(f"[Apilot] API request failed: {e}")
-            return {"success": False, "message": str(e)}
+            return {"success": False, "message": str(e), "error": type(e).__name__}
 
     def create_reply(self, reply_type, content):
         reply = Reply()
@@ -762,65 +1351,170 @@ class Apilot(Plugin):
             return False
 
     def is_valid_image_url(self, url):
+        # 最近下载或探测过的链接直接使用结果，不再发请求
+        valid = self.validated_urls.get(url)
+        if valid is not None:
+            return valid
         try:
-            response = requests.head(url)  # Using HEAD request to check the URL header
-            return response.status_code == 200
+            response = self.http.head(url)  # Using HEAD request to check the URL header
+            valid = response.status_code == 200
+            self.validated_urls.set(url, valid, VALIDATED_URL_TTL)
+            return valid
         except requests.RequestException as e:
             return False
 
     def download_image(self, image_url):
-        """从URL下载图片并保存到本地临时文件
-        
+        """下载图片，超出尺寸或字节预算时按 download 编码配置压缩后再发送
+
+        Returns:
+            str: 本地文件路径，如果下载失败则返回None
+        """
+        path = self.fetch_image(image_url)
+        if not path:
+            return None
+        encode_key = f"encoded:{path}:{self.image_encoder.profile(DOWNLOAD).key}"
+        encoded_path = self.render_cache.get(encode_key)
+        if encoded_path and os.path.isfile(encoded_path):
+            return encoded_path
+        try:
+            encoded = self.image_encoder.shrink_file(path, DOWNLOAD)
+        except Exception as e:
+            logger.warn(f"[Apilot] 图片压缩失败，发送原图: {e}")
+            return path
+        encoded_path = self.image_store.put_bytes(*encoded) if encoded else path
+        self.render_cache.set(encode_key, encoded_path, RENDER_CACHE_TTL)
+        return encoded_path
+
+    def fetch_image(self, image_url):
+        """从URL下载图片并保存到插件图片缓存
+
+        同一URL在免验证期内直接复用本地文件，之后带 ETag 做条件请求，未变化时不重新下载。
+        状态码、Content-Type 和文件头都在这一次 GET 中校验，无需事先 HEAD 探测。
+
         Args:
             image_url: 图片URL
-            
+
         Returns:
-            str: 临时文件路径，如果下载失败则返回None
+            str: 本地文件路径，如果下载失败则返回None
         """
         try:
-            response = requests.get(image_url, stream=True, timeout=15)
-            if response.status_code == 200:
-                # 获取文件扩展名
-                content_type = response.headers.get('Content-Type', '')
-                if 'image/jpeg' in content_type or 'image/jpg' in content_type:
-                    ext = '.jpg'
-                elif 'image/png' in content_type:
-                    ext = '.png'
-                elif 'image/gif' in content_type:
-                    ext = '.gif'
-                else:
-                    ext = '.jpg'  # 默认使用jpg
-                
-                # 创建临时文件
-                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=ext)
-                for chunk in response.iter_content(chunk_size=1024):
-                    if chunk:
-                        temp_file.write(chunk)
-                temp_file.close()
-                logger.info(f"[Apilot] 图片下载成功，保存至: {temp_file.name}")
-                return temp_file.name
-            else:
-                logger.error(f"[Apilot] 图片下载失败，状态码: {response.status_code}")
-                return None
+            cached_path, etag, fresh = self.image_store.get_download(image_url)
+            if cached_path and fresh:
+                self.metrics.cache_requests.inc("image", "hit")
+                return cached_path
+            headers = {"If-None-Match": etag} if cached_path and etag else None
+            try:
+                response = self.http.get(image_url, stream=True, headers=headers, timeout=(self.http.timeout[0], 15))
+            except requests.RequestException as e:
+                if cached_path:
+                    # 上游故障或熔断时使用之前下载的图片
+                    logger.warn(f"[Apilot] 图片刷新失败，使用缓存: {e}")
+                    return cached_path
+                raise
+            with response:
+                if response.status_code == 304 and cached_path:
+                    self.metrics.cache_requests.inc("image", "revalidated")
+                    self.image_store.mark_revalidated(image_url)
+                    return cached_path
+                if response.status_code != 200 and cached_path:
+                    logger.warn(f"[Apilot] 图片刷新失败，状态码: {response.status_code}，使用缓存")
+                    return cached_path
+                self.metrics.cache_requests.inc("image", "miss")
+                if response.status_code != 200:
+                    logger.error(f"[Apilot] 图片下载失败，状态码: {response.status_code}")
+                    self.validated_urls.set(image_url, False, VALIDATED_URL_TTL)
+                    return None
+                # 在读取正文前根据 Content-Type 提前放弃，例如返回的是错误页面
+                content_type = response.headers.get('Content-Type', '').lower()
+                if content_type and not content_type.startswith(('image/', 'application/octet-stream', 'binary/')):
+                    logger.error(f"[Apilot] 图片下载失败，Content-Type: {content_type}")
+                    self.validated_urls.set(image_url, False, VALIDATED_URL_TTL)
+                    return None
+                # 根据文件头确定图片格式
+                chunks = response.iter_content(chunk_size=8192)
+                head = next(chunks, b"")
+                ext = image_ext_from_magic(head)
+                if not ext:
+                    logger.error(f"[Apilot] 图片下载失败，不是有效的图片数据: {image_url}")
+                    self.validated_urls.set(image_url, False, VALIDATED_URL_TTL)
+                    return None
+
+                path = self.image_store.put_download(image_url, response.headers.get('ETag'), ext,
+                                                     itertools.chain([head], chunks))
+            self.validated_urls.set(image_url, True, VALIDATED_URL_TTL)
+            logger.info(f"[Apilot] 图片下载成功，保存至: {path}")
+            return path
         except Exception as e:
             logger.error(f"[Apilot] 图片下载异常: {e}")
             return None
 
-    def load_city_conditions(self):
-        if self.condition_2_and_3_cities is None:
-            try:
-                json_file_path = os.path.join(os.path.dirname(__file__), 'duplicate-citys.json')
-                with open(json_file_path, 'r', encoding='utf-8') as f:
-                    self.condition_2_and_3_cities = json.load(f)
-            except Exception as e:
-                return self.handle_error(e, "加载condition_2_and_3_cities.json失败")
+    def warm_up(self):
+        timer = StartupTimer()
+        try:
+            from .text_render import find_font_path, get_font
+            timer.mark("warmup_pil")
+            font_path = find_font_path()
+            get_font(font_path, 28)
+            get_font(font_path, 20)
+            timer.mark("warmup_fonts")
+            self.image_store.ensure_loaded()
+            timer.mark("warmup_images")
+            self.load_city_index()
+            timer.mark("warmup_city_index")
+            self.load_word_index()
+            timer.mark("warmup_word_index")
+        except Exception as e:
+            logger.error(f"[Apilot] warm up failed: {e}")
+        timer.record(self.metrics.startup_seconds)
+        logger.info(f"[Apilot] warm up finished in {timer.summary()}")
+
+    def load_city_index(self):
+        if self.city_index is None:
+            with self._city_index_lock:
+                if self.city_index is None:
+                    try:
+                        self.city_index = CityIndex.load(os.path.dirname(__file__))
+                    except Exception as e:
+                        self.handle_error(e, "加载城市索引失败")
+                        self.city_index = CityIndex([])
+        return self.city_index
+
+    def load_word_index(self):
+        if not self._word_index_loaded:
+            with self._word_index_lock:
+                if not self._word_index_loaded:
+                    try:
+                        self.word_index = WordIndex.load(os.path.dirname(__file__))
+                    except Exception as e:
+                        self.handle_error(e, "加载字典索引失败")
+                    self._word_index_loaded = True
+        return self.word_index
+
+    def is_known_city(self, city_or_id):
+        """城市ID或本地城市索引中的城市名，多城市天气只查询这些城市"""
+        return city_or_id.isnumeric() or self.load_city_index().contains(city_or_id)
+
+    def resolve_city(self, city_or_id):
+        """将城市名解析为天气接口的查询参数
 
-    def check_multiple_city_ids(self, city):
-        self.load_city_conditions()
-        city_info = self.condition_2_and_3_cities.get(city, None)
-        if city_info:
-            return city_info
-        return None
+        Returns:
+            dict: {'city_id': ...} 或本地无法解析时的 {'city': ...}；有多个同名城市或城市不存在时返回提示文本
+        """
+        if city_or_id.isnumeric():  # 判断是否为纯数字，也即是否为 city_id
+            return {'city_id': city_or_id}
+        match = self.load_city_index().resolve(city_or_id)
+        if match.status == "found":
+            return {'city_id': match.city_id}
+        if match.status == "ambiguous":
+            formatted_city_info = "\n".join(
+                [f"{idx + 1}) {row[2]}--{row[3]}, ID: {row[0]}" for idx, row in enumerate(match.rows)]
+            )
+            return f"查询 <{city_or_id}> 具有多条数据：\n{formatted_city_info}\n请使用id查询，发送“id天气”"
+        if self.city_index.complete:
+            tips = f"，您是不是要查：{'、'.join(match.suggestions)}" if match.suggestions else ""
+            return f"未找到城市 <{city_or_id}>{tips}"
+        # 没有完整的城市表时交给接口按名称查询
+        return {'city': city_or_id}
 
     def text_to_image(self, text, title=None, font_path=None, width=800, padding=20, line_spacing=10, background_color=(255, 255, 255), title_color=(31, 120, 180), text_color=(0, 0, 0)):
         """将文本转换为图片
@@ -837,112 +1531,51 @@ class Apilot(Plugin):
             text_color: 正文颜色，默认黑色
 
         Returns:
-            临时图片文件的路径
+            图片缓存中的文件路径
         """
+        def render():
+            # PIL 只在第一次渲染时导入
+            from .text_render import render_text_image
+            with self.metrics.render_latency.time():
+                image = render_text_image(
+                    text, title=title, font_path=font_path, width=width, padding=padding,
+                    line_spacing=line_spacing, background_color=background_color,
+                    title_color=title_color, text_color=text_color, shadow=self.render_shadow,
+                )
+
+            # 按配置编码后以内容哈希保存到图片缓存，相同内容只保存一份
+            return self.image_store.put_bytes(*self.image_encoder.encode(image, RENDER))
+
         try:
-            # 使用默认字体
-            if font_path is None or not os.path.exists(font_path):
-                # 尝试常见的中文字体路径
-                common_fonts = [
-                    "/System/Library/Fonts/PingFang.ttc",  # macOS
-                    "C:/Windows/Fonts/msyh.ttc",  # Windows
-                    "C:/Windows/Fonts/simhei.ttf",  # Windows
-                    "/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf",  # Linux
-                ]
-                
-                for f in common_fonts:
-                    if os.path.exists(f):
-                        font_path = f
-                        break
-            
-            # 创建字体对象
-            try:
-                title_font = ImageFont.truetype(font_path, 28) if font_path else ImageFont.load_default()
-                body_font = ImageFont.truetype(font_path, 20) if font_path else ImageFont.load_default()
-            except Exception as e:
-                logger.error(f"加载字体失败: {e}，使用默认字体")
-                title_font = ImageFont.load_default()
-                body_font = ImageFont.load_default()
-            
-            # 计算行宽和总高度
-            lines = []
-            current_y = padding
-            
-            # 添加标题
-            if title:
-                lines.append(("title", title))
-                title_bbox = title_font.getbbox(title)
-                title_height = title_bbox[3] - title_bbox[1]
-                current_y += title_height + line_spacing * 2
-            
-            # 分行处理文本
-            for line in text.split('\n'):
-                if not line.strip():  # 空行处理
-                    current_y += line_spacing
-                    lines.append(("empty", ""))
-                    continue
-                
-                # 计算一行能容纳的文字数
-                char_width_avg = body_font.getbbox("测试")[2] / 2  # 简单估算平均字符宽度
-                max_chars_per_line = int((width - padding * 2) / char_width_avg)
-                
-                # 如果单行长度超过最大宽度，拆分
-                if len(line) > max_chars_per_line:
-                    for i in range(0, len(line), max_chars_per_line):
-                        sub_line = line[i:i+max_chars_per_line]
-                        lines.append(("text", sub_line))
-                        char_bbox = body_font.getbbox(sub_line)
-                        char_height = char_bbox[3] - char_bbox[1]
-                        current_y += char_height + line_spacing
-                else:
-                    lines.append(("text", line))
-                    char_bbox = body_font.getbbox(line)
-                    char_height = char_bbox[3] - char_bbox[1]
-                    current_y += char_height + line_spacing
-            
-            # 创建图像，高度根据文本内容动态确定
-            height = current_y + padding
-            image = Image.new('RGB', (width, height), background_color)
-            draw = ImageDraw.Draw(image)
-            
-            # 绘制文本
-            current_y = padding
-            for line_type, line_text in lines:
-                if line_type == "empty":
-                    current_y += line_spacing
-                    continue
-                
-                if line_type == "title":
-                    draw.text((padding, current_y), line_text, font=title_font, fill=title_color)
-                    title_bbox = title_font.getbbox(line_text)
-                    title_height = title_bbox[3] - title_bbox[1]
-                    current_y += title_height + line_spacing * 2
-                    
-                    # 标题下划线
-                    draw.line([(padding, current_y - line_spacing), 
-                            (width - padding, current_y - line_spacing)], 
-                            fill=title_color, width=2)
-                else:
-                    draw.text((padding, current_y), line_text, font=body_font, fill=text_color)
-                    char_bbox = body_font.getbbox(line_text)
-                    char_height = char_bbox[3] - char_bbox[1]
-                    current_y += char_height + line_spacing
-            
-            # 添加轻微的阴影效果
-            blurred = image.filter(ImageFilter.GaussianBlur(radius=1))
-            image = Image.blend(blurred, image, alpha=0.8)
-            
-            # 保存到临时文件
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
-            image.save(temp_file.name)
-            temp_file.close()
-            
-            return temp_file.name
+            render_key = hashlib.sha1(repr((text, title, font_path, width, padding, line_spacing, background_color,
+                                            title_color, text_color, self.render_shadow,
+                                            self.image_encoder.profile(RENDER).key)).encode("utf-8")).hexdigest()
+            # 相同输入已经渲染过且图片仍在缓存目录中时直接复用
+            img_path = self.render_cache.get(render_key)
+            if img_path and os.path.isfile(img_path):
+                return img_path
+            # 相同输入同时只渲染一次
+            img_path = self.render_flight.do(render_key, render)
+            self.render_cache.set(render_key, img_path, RENDER_CACHE_TTL)
+            return img_path
         except Exception as e:
             logger.error(f"生成图片失败: {e}")
             return None
 
 
+def image_ext_from_magic(head):
+    """根据文件头判断图片格式，返回扩展名，不是图片时返回None"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return ".gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
 ZODIAC_MAPPING = {
     '白羊座': 'aries',
     '金牛座': 'taurus',
@@ -0,0 +1,115 @@
+import threading
+import time
+from .cache import TTLCache
+from .token_pool import TokenBucket
+
+# 指令按开销分类：render 需要下载或渲染图片，quota 消耗上游接口额度，其余为 cheap
+RENDER = "render"
+QUOTA = "quota"
+CHEAP = "cheap"
+COMMAND_CLASSES = {
+    "morning_news": RENDER,
+    "moyu": RENDER,
+    "bagua": RENDER,
+    "express": QUOTA,
+    "express_subscribe": QUOTA,
+    "horoscope": QUOTA,
+    "hot_trends": QUOTA,
+    "hot_trends_all": QUOTA,
+    "word": QUOTA,
+    "gold": QUOTA,
+    "oil": QUOTA,
+    "weather": QUOTA,
+    "weather_batch": QUOTA,
+}
+
+# 每类指令每分钟允许的次数，user 为单个发送者，chat 为整个群；0 表示不限制
+DEFAULT_RATE_LIMITS = {
+    RENDER: {"user": 6, "chat": 15},
+    QUOTA: {"user": 10, "chat": 30},
+    CHEAP: {"user": 30, "chat": 90},
+}
+# 同一个群在这段时间(秒)内发送的相同指令只回复一次，私聊不合并
+DEFAULT_DUPLICATE_WINDOW = 10
+DEFAULT_SHED_REPLY = "操作太频繁啦，请稍后再试"
+# 同一个群同一类指令被限流时，最多每隔这么久(秒)回复一次提示，其余直接忽略；私聊每次都回复
+SHED_NOTICE_INTERVAL = 30
+# 令牌桶闲置超过这段时间(秒)后已经补满，可以丢弃
+BUCKET_IDLE_TTL = 120
+
+ADMIT = "admit"
+DUPLICATE = "duplicate"
+SHED = "shed"
+SHED_SILENT = "shed_silent"
+
+
+class Admission:
+    """指令的准入控制
+
+    在分发指令前判断：同一个群短时间内的重复指令直接丢弃，由第一条的回复代表；
+    每类指令对发送者和群各有一个令牌桶，任一耗尽时拒绝执行，只回复一句固定提示。
+    默认关闭，配置 admission 为 true 后生效。
+
+    Args:
+        limits: {指令类别: {"user": 每分钟次数, "chat": 每分钟次数}}
+        duplicate_window: 相同指令的合并窗口(秒)，0 表示不合并
+    """
+
+    def __init__(self, limits, duplicate_window=DEFAULT_DUPLICATE_WINDOW, shed_reply=DEFAULT_SHED_REPLY):
+        self.limits = limits
+        self.duplicate_window = duplicate_window
+        self.shed_reply = shed_reply
+        self._lock = threading.Lock()
+        self._buckets = TTLCache(max_entries=4096)  # (类别, user/chat, id) -> TokenBucket
+        self._recent = TTLCache(max_entries=4096)  # (会话, 指令, 参数)，窗口内存在即为重复
+        self._notices = TTLCache(max_entries=1024)  # (会话, 类别)，间隔内已回复过限流提示
+
+    @classmethod
+    def from_config(cls, conf):
+        """未开启 admission 时返回 None；rate_limits 按类别覆盖默认限额，未配置的类别和范围沿用默认值"""
+        conf = conf or {}
+        if not conf.get("admission"):
+            return None
+        overrides = conf.get("rate_limits") or {}
+        limits = {name: dict(default, **(overrides.get(name) or {})) for name, default in DEFAULT_RATE_LIMITS.items()}
+        return cls(limits,
+                   duplicate_window=conf.get("duplicate_window", DEFAULT_DUPLICATE_WINDOW),
+                   shed_reply=conf.get("rate_limit_reply", DEFAULT_SHED_REPLY))
+
+    def _bucket(self, command_class, scope, scope_id):
+        per_minute = self.limits.get(command_class, {}).get(scope)
+        if not per_minute or not scope_id:
+            return None
+        key = (command_class, scope, scope_id)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(per_minute / 60, capacity=per_minute)
+        self._buckets.set(key, bucket, BUCKET_IDLE_TTL)
+        return bucket
+
+    def check(self, command, chat_id, user_id):
+        """返回 ADMIT、DUPLICATE、SHED(需要回复提示) 或 SHED_SILENT"""
+        command_class = COMMAND_CLASSES.get(command.name, CHEAP)
+        # 私聊中重复发送通常是没收到回复，照常执行
+        group = chat_id != user_id
+        recent_key = (chat_id, command.name, command.args)
+        with self._lock:
+            if group and self.duplicate_window and self._recent.get(recent_key) is not None:
+                return DUPLICATE
+            buckets = [self._bucket(command_class, "user", user_id)]
+            if group:
+                buckets.append(self._bucket(command_class, "chat", chat_id))
+            buckets = [bucket for bucket in buckets if bucket is not None]
+            now = time.monotonic()
+            # 所有桶都有余量时才扣减，被会话限额拒绝的请求不占用个人额度
+            if any(bucket.available(now) < 1 for bucket in buckets):
+                notice_key = (chat_id, command_class)
+                if group and self._notices.get(notice_key) is not None:
+                    return SHED_SILENT
+                self._notices.set(notice_key, True, SHED_NOTICE_INTERVAL)
+                return SHED
+            for bucket in buckets:
+                bucket.take()
+            if group and self.duplicate_window:
+                self._recent.set(recent_key, True, self.duplicate_window)
+            return ADMIT
@@ -0,0 +1,53 @@
+"""插件导入耗时
+
+在新的解释器中用 -X importtime 导入插件模块，按累计耗时列出最慢的导入，并对比首次渲染需要的 text_render(PIL)。
+
+需要在 chatgpt-on-wechat 中运行(插件位于 <项目根目录>/plugins/<插件目录>)。
+
+用法: python benchmarks/bench_import.py [--top 15] [--cow-root PATH]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(cow_root, module):
+    """返回 [(累计耗时微秒, 自身耗时微秒, 模块名)]，按累计耗时降序"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=cow_root, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(result.stderr[-2000:])
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    return sorted(rows, reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--cow-root", default=os.path.dirname(os.path.dirname(PLUGIN_DIR)),
+                        help="chatgpt-on-wechat 项目根目录")
+    args = parser.parse_args()
+
+    package = f"plugins.{os.path.basename(PLUGIN_DIR)}"
+    for module in (f"{package}.Apilot", f"{package}.text_render"):
+        rows = import_times(args.cow_root, module)
+        target = next((row for row in rows if row[2].strip() == module), None)
+        total = target[0] / 1000 if target else float("nan")
+        print(f"\n== import {module}: {total:.1f} ms ==")
+        print(f"{'cumulative ms':>14}{'self ms':>10}  module")
+        for cumulative_us, self_us, name in rows[:args.top]:
+            print(f"{cumulative_us / 1000:>14.1f}{self_us / 1000:>10.1f}  {name}")
+    print("\n插件加载和预热各阶段的耗时见日志中的 “Plugin initialized successfully” 和 “warm up finished”，"
+          "或指标 apilot_startup_seconds")
+
+
+if __name__ == "__main__":
+    main()
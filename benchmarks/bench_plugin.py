@@ -0,0 +1,244 @@
+"""插件端到端基准
+
+启动本地测试桩(stub_server.py)，将插件的上游地址指向它，用伪造的 EventContext 直接调用
+on_handle_context，分别以单线程和 N 个并发发送者测量每个指令的 p50/p95/p99 延迟和吞吐量。
+
+需要在 chatgpt-on-wechat 中运行(插件位于 <项目根目录>/plugins/<插件目录>)，依赖项目本身的 bridge/plugins 模块。
+
+用法: python benchmarks/bench_plugin.py [--requests 50] [--concurrency 1,8] [--latency 0.05] [--error-rate 0.01]
+      [--commands 早报,北京天气] [--async] [--no-cache] [--no-token] [--cow-root PATH]
+"""
+import argparse
+import importlib
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PLUGIN_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from stub_server import StubServer  # noqa: E402
+
+# 指令名称 -> 触发该指令的消息
+COMMAND_MESSAGES = {
+    "morning_news": "早报",
+    "moyu": "摸鱼",
+    "moyu_video": "摸鱼视频",
+    "bagua": "八卦",
+    "express": "快递YT1234567890",
+    "horoscope": "白羊座",
+    "hot_trends": "微博热榜",
+    "hot_trends_all": "全部热榜",
+    "word": "查字典 你",
+    "gold": "黄金",
+    "oil": "广东油价",
+    "weather": "北京天气",
+    "weather_future": "上海7天天气",
+    "weather_batch": "北京 上海 广州天气",
+}
+# 不配置 token 时可用的指令，走 vvhan/dayu 接口
+NO_TOKEN_COMMANDS = ("morning_news", "moyu", "moyu_video", "bagua", "horoscope", "hot_trends", "hot_trends_all")
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class FakeChannel:
+    """记录异步模式下通过 channel 发送的回复"""
+
+    def __init__(self):
+        self._waiters = {}
+        self._lock = threading.Lock()
+
+    def expect(self, context):
+        event = threading.Event()
+        with self._lock:
+            self._waiters[id(context)] = event
+        return event
+
+    def forget(self, context):
+        with self._lock:
+            self._waiters.pop(id(context), None)
+
+    def send(self, reply, context):
+        with self._lock:
+            event = self._waiters.pop(id(context), None)
+        if event:
+            event.reply = reply
+            event.set()
+
+
+def import_plugin_module(cow_root, name):
+    if cow_root not in sys.path:
+        sys.path.insert(0, cow_root)
+    return importlib.import_module(f"plugins.{os.path.basename(PLUGIN_DIR)}.{name}")
+
+
+def build_plugin(plugin_class, conf):
+    # Apilot.__init__ 通过 self.load_config() 读取配置，子类覆盖后不会读取 chatgpt-on-wechat 的插件配置
+    class BenchApilot(plugin_class):
+        def load_config(self):
+            return conf
+
+    plugin = BenchApilot()
+    if plugin.base_url_alapi != conf["base_urls"]["alapi"]:
+        raise SystemExit("bench config was not applied, refusing to send requests to the real upstream")
+    return plugin
+
+
+def send(plugin, channel, content, timeout):
+    """发送一条消息，返回 (耗时, 是否成功)"""
+    from bridge.context import Context, ContextType
+    from plugins import Event, EventContext
+
+    context = Context(ContextType.TEXT, content, kwargs={"isgroup": False, "msg": None})
+    e_context = EventContext(Event.ON_HANDLE_CONTEXT, {"channel": channel, "context": context, "reply": None})
+    event = channel.expect(context)
+    start = time.perf_counter()
+    plugin.on_handle_context(e_context)
+    reply = e_context["reply"]
+    if reply is None:
+        # 异步模式下超过 sync_wait 的指令，完成后通过 channel 发送
+        if not event.wait(timeout):
+            return time.perf_counter() - start, False
+        reply = event.reply
+    else:
+        channel.forget(context)
+    elapsed = time.perf_counter() - start
+    return elapsed, reply is not None and reply.content is not None
+
+
+def run(plugin, channel, content, count, concurrency, timeout):
+    """N 个发送者并发发送同一条消息共 count 次，返回 (排序后的耗时列表, 失败数, 总耗时)"""
+    jobs = queue.Queue()
+    for _ in range(count):
+        jobs.put(content)
+    latencies = []
+    failures = [0]
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            try:
+                message = jobs.get_nowait()
+            except queue.Empty:
+                return
+            elapsed, ok = send(plugin, channel, message, timeout)
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    failures[0] += 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), failures[0], time.perf_counter() - start
+
+
+def check_weather_cache(plugin, channel, stub, timeout):
+    """再次查询同一城市的天气时应命中天气缓存，不再请求上游
+
+    测试桩返回的 city_id 与请求的不同，按 id 查询也要用请求的 id 命中缓存。
+    """
+    for content, path in (("上海明天天气", "/alapi/api/tianqi/seven"), ("101020100天气", "/alapi/api/tianqi")):
+        send(plugin, channel, content, timeout)
+        before = stub.paths.get(path, 0)
+        elapsed, ok = send(plugin, channel, content, timeout)
+        if not ok or stub.paths.get(path, 0) != before:
+            raise SystemExit(f"weather cache check failed: second {content} requested {path} again")
+        print(f"weather cache check passed for {content} ({elapsed * 1000:.1f}ms, no upstream call)")
+
+
+def check_no_token(stub):
+    """不配置 token 时早报应请求 vvhan 的 60s 接口"""
+    if not stub.paths.get("/vvhan/api/60s"):
+        raise SystemExit("no-token check failed: 早报 did not request /vvhan/api/60s")
+    print("no-token check passed (早报 served by /vvhan/api/60s)")
+
+
+def report_header(concurrency):
+    print(f"\n== concurrency {concurrency} ==")
+    print(f"{'command':<16}{'n':>6}{'fail':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}")
+
+
+def report_row(name, latencies, failures, wall):
+    print(f"{name:<16}{len(latencies):>6}{failures:>6}"
+          f"{percentile(latencies, 0.50) * 1000:>10.1f}{percentile(latencies, 0.95) * 1000:>10.1f}"
+          f"{percentile(latencies, 0.99) * 1000:>10.1f}{len(latencies) / wall:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50, help="每个并发档位下每个指令发送的次数")
+    parser.add_argument("--concurrency", default="1,8", help="并发发送者数量，逗号分隔，依次测试")
+    parser.add_argument("--commands", default="", help="只测试这些消息，逗号分隔；默认全部指令")
+    parser.add_argument("--latency", type=float, default=0.02, help="测试桩的固定延迟(秒)")
+    parser.add_argument("--jitter", type=float, default=0.01, help="测试桩的随机延迟上限(秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="测试桩返回 500 的比例")
+    parser.add_argument("--async", dest="async_mode", action="store_true", help="开启插件的 async_mode")
+    parser.add_argument("--no-cache", action="store_true", help="关闭响应缓存，每次都请求上游")
+    parser.add_argument("--no-token", action="store_true", help="不配置 alapi token，只测试走 vvhan/dayu 接口的指令")
+    parser.add_argument("--timeout", type=float, default=30, help="单个请求的最长等待时间(秒)")
+    parser.add_argument("--cow-root", default=os.path.dirname(os.path.dirname(PLUGIN_DIR)),
+                        help="chatgpt-on-wechat 项目根目录")
+    args = parser.parse_args()
+
+    stub = StubServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=1).start()
+    plugin_class = import_plugin_module(args.cow_root, "Apilot").Apilot
+    cache_policies = import_plugin_module(args.cow_root, "cache").DEFAULT_CACHE_POLICIES
+
+    conf = {
+        "alapi_token": "" if args.no_token else "bench-token",
+        "base_urls": stub.base_urls,
+        "image_cache_dir": tempfile.mkdtemp(prefix="apilot-bench-"),
+        "async_mode": args.async_mode,
+        "placeholder_text": "",
+        "http_retries": 0,
+    }
+    if args.no_cache:
+        conf["cache_ttl"] = {name: 0 for name in cache_policies}
+    plugin = build_plugin(plugin_class, conf)
+    channel = FakeChannel()
+
+    if args.commands:
+        selected = {content: content for content in args.commands.split(",") if content}
+    elif args.no_token:
+        selected = {name: COMMAND_MESSAGES[name] for name in NO_TOKEN_COMMANDS}
+    else:
+        selected = dict(COMMAND_MESSAGES)
+    # 预热：加载城市索引、字体等一次性开销不计入结果
+    for content in selected.values():
+        send(plugin, channel, content, args.timeout)
+    if stub.requests == 0:
+        raise SystemExit("stub received no requests during warm-up, the plugin is not using the bench base_urls")
+    if args.no_token:
+        if "早报" in selected.values():
+            check_no_token(stub)
+    else:
+        check_weather_cache(plugin, channel, stub, args.timeout)
+
+    print(f"stub {stub.url}: latency {args.latency * 1000:.0f}ms +{args.jitter * 1000:.0f}ms, "
+          f"error rate {args.error_rate:.1%}, cache {'off' if args.no_cache else 'on'}, "
+          f"async {'on' if args.async_mode else 'off'}, token {'off' if args.no_token else 'on'}")
+    for concurrency in (int(n) for n in args.concurrency.split(",")):
+        report_header(concurrency)
+        for name, content in selected.items():
+            latencies, failures, wall = run(plugin, channel, content, args.requests, concurrency, args.timeout)
+            report_row(name, latencies, failures, wall)
+    print(f"\nstub served {stub.requests} requests ({stub.errors} injected errors)")
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""指令解析微基准
+
+对比 CommandRouter 与原先 on_handle_context 中逐条判断的写法，并校验两者在语料上的解析结果一致。
+
+用法: python benchmarks/bench_router.py [--rounds N]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from router import CommandRouter  # noqa: E402
+
+# 群聊中的典型消息：绝大多数是普通聊天，少量是指令
+CHAT_MESSAGES = [
+    "哈哈哈哈", "今天中午吃什么", "有人一起打游戏吗", "收到", "好的👌", "[捂脸]", "这个热度有点高啊",
+    "明天开会记得带电脑", "你看昨天的比赛了吗，最后那个球太离谱了", "早", "晚安", "发个红包吧",
+    "https://example.com/article/123", "我觉得这个方案还需要再讨论一下，尤其是预算部分", "好热啊今天",
+    "谁知道这个快递到哪了", "周末去爬山吗", "1", "？", "@张三 你来一下",
+]
+COMMAND_MESSAGES = [
+    "早报", "摸鱼", "摸鱼视频", "八卦", "黄金", "快递YT1234567890", "快递SF123456:1234", "白羊座", "蛇夫座",
+    "微博热榜", "知乎日报热榜", "今天的微博热榜", "查字典 你", "广东油价", "广西省油价", "北京天气", "上海明天天气",
+    "广州7天天气", "101010100天气", "朝阳区的天气",
+]
+CORPUS = CHAT_MESSAGES * 9 + COMMAND_MESSAGES
+
+
+def legacy_route(content):
+    """原先 on_handle_context 的判断顺序，正则在每条消息上现场匹配"""
+    if content in ("早报", "摸鱼", "摸鱼视频", "八卦"):
+        return {"早报": "morning_news", "摸鱼": "moyu", "摸鱼视频": "moyu_video", "八卦": "bagua"}[content], ()
+    if content.startswith("快递"):
+        return "express", (content[2:].strip(),)
+    horoscope_match = re.match(r'^([一-龥]{2}座)$', content)
+    if horoscope_match:
+        return "horoscope", (horoscope_match.group(1),)
+    hot_trend_match = re.search(r'(.{1,6})热榜$', content)
+    if hot_trend_match:
+        return "hot_trends", (hot_trend_match.group(1).strip(),)
+    word_match = re.match(r'^查字典\s+(.+)$', content)
+    if word_match:
+        return "word", (word_match.group(1),)
+    if content == "黄金":
+        return "gold", ()
+    oil_match = re.match(r'^(.{2,7}?)(?:省|市)?油价$', content)
+    if oil_match:
+        return "oil", (oil_match.group(1),)
+    weather_match = re.match(r'^(?:(.{2,7}?)(?:市|县|区|镇)?|(\d{7,9}))(:?今天|明天|后天|7天|七天)?(?:的)?天气$', content)
+    if weather_match:
+        return "weather", (weather_match.group(1) or weather_match.group(2), weather_match.group(3), content)
+    return None
+
+
+def bench(func, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for content in CORPUS:
+            func(content)
+    elapsed = time.perf_counter() - start
+    return elapsed / (rounds * len(CORPUS)) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    router = CommandRouter()
+    for content in CORPUS:
+        command = router.route(content)
+        expected = legacy_route(content)
+        actual = tuple(command) if command else None
+        assert actual == expected, f"{content!r}: {actual} != {expected}"
+
+    legacy_ns = bench(legacy_route, args.rounds)
+    router_ns = bench(router.route, args.rounds)
+    print(f"corpus: {len(CORPUS)} messages ({len(COMMAND_MESSAGES)} commands)")
+    print(f"legacy chain : {legacy_ns:8.1f} ns/msg")
+    print(f"CommandRouter: {router_ns:8.1f} ns/msg ({legacy_ns / router_ns:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
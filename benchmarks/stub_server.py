@@ -0,0 +1,174 @@
+"""本地上游测试桩
+
+按请求路径回放 fixtures 目录下录制的 JSON 和图片，可注入延迟和错误率，用于在没有网络的机器上压测插件。
+三个上游分别挂在 /vvhan/api/、/alapi/api/ 和 /dayu/ 下，插件通过 base_urls 配置指向这里。
+
+JSON 路径按最长前缀匹配，例如 /vvhan/api/hotlist/wbHot 使用 fixtures/vvhan/api/hotlist.json；
+fixture 中的 {stub} 会替换为测试桩自身的地址，图片和视频放在 fixtures/media 下。
+
+用法: python benchmarks/stub_server.py [--port 8765] [--latency 0.05] [--jitter 0.02] [--error-rate 0.01]
+"""
+import argparse
+import hashlib
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+MEDIA_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".gif": "image/gif", ".mp4": "video/mp4"}
+
+
+class StubServer:
+    """在后台线程中运行的测试桩
+
+    Args:
+        port: 监听端口，0 表示随机分配
+        latency: 每个请求的固定延迟(秒)
+        jitter: 在固定延迟之上叠加的随机延迟上限(秒)
+        error_rate: 返回 HTTP 500 的请求比例
+    """
+
+    def __init__(self, port=0, latency=0.0, jitter=0.0, error_rate=0.0, fixtures_dir=FIXTURES_DIR, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.fixtures_dir = fixtures_dir
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.paths = {}  # 请求路径 -> 次数，用于确认插件确实请求了测试桩
+        self._lock = threading.Lock()
+        self._files = {}  # 路径 -> 文件内容，fixture 只读一次
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = None
+
+    @property
+    def base_urls(self):
+        return {
+            "vvhan": f"{self.url}/vvhan/api/",
+            "alapi": f"{self.url}/alapi/api/",
+            "dayu": f"{self.url}/dayu/",
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="apilot-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _read(self, path):
+        body = self._files.get(path)
+        if body is None:
+            with open(path, "rb") as f:
+                body = f.read()
+            if path.endswith(".json"):
+                body = body.replace(b"{stub}", self.url.encode())
+            self._files[path] = body
+        return body
+
+    def resolve(self, path):
+        """返回 (fixture 文件路径, Content-Type)，找不到时返回 (None, None)"""
+        parts = [part for part in path.split("/") if part and part not in (".", "..")]
+        if parts and parts[0] == "media":
+            file_path = os.path.join(self.fixtures_dir, *parts)
+            ext = os.path.splitext(file_path)[1]
+            if os.path.isfile(file_path):
+                return file_path, MEDIA_TYPES.get(ext, "application/octet-stream")
+            return None, None
+        while parts:
+            file_path = os.path.join(self.fixtures_dir, *parts) + ".json"
+            if os.path.isfile(file_path):
+                return file_path, "application/json; charset=utf-8"
+            parts.pop()
+        return None, None
+
+    def _delay(self):
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _should_fail(self, path):
+        with self._lock:
+            self.requests += 1
+            self.paths[path] = self.paths.get(path, 0) + 1
+            fail = self.error_rate > 0 and self.random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+            return fail
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _respond(self, send_body):
+                # 读取并丢弃请求体，保证 keep-alive 连接可以继续使用
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                stub._delay()
+                if stub._should_fail(urlparse(self.path).path):
+                    return self._send(500, b'{"code": 500, "msg": "injected error"}', "application/json", send_body)
+                file_path, content_type = stub.resolve(urlparse(self.path).path)
+                if file_path is None:
+                    return self._send(404, b'{"code": 404, "msg": "no fixture"}', "application/json", send_body)
+                body = stub._read(file_path)
+                etag = '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+                if self.headers.get("If-None-Match") == etag:
+                    return self._send(304, b"", content_type, send_body, etag)
+                return self._send(200, body, content_type, send_body, etag)
+
+            def _send(self, status, body, content_type, send_body, etag=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                if etag:
+                    self.send_header("ETag", etag)
+                self.end_headers()
+                if send_body and status != 304:
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                self._respond(True)
+
+            def do_POST(self):
+                self._respond(True)
+
+            def do_HEAD(self):
+                self._respond(False)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="固定延迟(秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="随机延迟上限(秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的比例")
+    args = parser.parse_args()
+
+    stub = StubServer(args.port, args.latency, args.jitter, args.error_rate)
+    print(f"stub upstream listening on {stub.url}")
+    print("base_urls:", stub.base_urls)
+    try:
+        stub.httpd.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
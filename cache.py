@@ -0,0 +1,289 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qsl
+from common.log import logger
+
+# 各接口的默认缓存时间(秒)，"midnight" 表示缓存到当天结束
+# 按 URL 路径中的接口名匹配，未列出的接口(如快递)不缓存；天气和查字典各自按城市、按字缓存
+DEFAULT_CACHE_POLICIES = {
+    "hotlist": 300,
+    "star": "midnight",
+    "horoscope": "midnight",
+    "zaobao": "midnight",
+    "60s": "midnight",
+    "moyu": "midnight",
+    "moyuribao": "midnight",
+    "moyuribaoshipin": "midnight",
+    "mingxingbagua": 1800,
+    "oil": 3600,
+    "gold": 60,
+}
+
+# 缓存键中不参与计算、日志中需要隐藏的参数
+SECRET_PARAMS = ("token",)
+
+# 按天更新的接口返回的数据不是今天时，只短暂缓存，等待上游发布新内容
+NOT_YET_PUBLISHED_TTL = 600
+
+# 数据中的日期，兼容 "2024-06-01"、"2024-06-01 08:00:00"、"2024年6月1日" 等写法
+_DATE_RE = re.compile(r"(\d{4})\D{1,3}(\d{1,2})\D{1,3}(\d{1,2})")
+
+# 过期后仍保留多久(秒)，上游故障时用作兜底数据
+DEFAULT_STALE_TTL = 86400
+# 过期不超过这段时间(秒)的数据直接返回，同时在后台刷新
+DEFAULT_SWR_WINDOW = 60
+
+# 兜底返回的过期数据上带的标记，值为数据过期的时间戳
+STALE_MARKER = "_apilot_stale_since"
+
+
+def seconds_until_midnight(now=None):
+    now = now or datetime.now()
+    tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return max(1, int((tomorrow - now).total_seconds()))
+
+
+def payload_date(payload):
+    """按天更新的接口返回的数据日期(YYYY-MM-DD)
+
+    依次查找 data.date(早报等)、data.day.date(ALAPI 星座)和 data.time(vvhan 星座)，都没有时返回 None
+    """
+    data = payload.get("data") if isinstance(payload, dict) else None
+    if not isinstance(data, dict):
+        return None
+    day = data.get("day")
+    for value in (data.get("date"), day.get("date") if isinstance(day, dict) else None, data.get("time")):
+        match = _DATE_RE.search(value) if isinstance(value, str) else None
+        if match:
+            year, month, day_of_month = match.groups()
+            return f"{year}-{int(month):02d}-{int(day_of_month):02d}"
+    return None
+
+
+def request_key(method, url, params=None, data=None, json_data=None):
+    """将请求归一化为字符串：合并 URL 查询参数和请求参数并排序，去掉 token"""
+    parsed = urlparse(url)
+    items = parse_qsl(parsed.query)
+    for extra in (params, data, json_data):
+        if isinstance(extra, dict):
+            items.extend((str(k), str(v)) for k, v in extra.items())
+        elif isinstance(extra, (str, bytes)):
+            items.extend(parse_qsl(extra.decode() if isinstance(extra, bytes) else extra))
+    items = sorted((k, v) for k, v in items if k not in SECRET_PARAMS)
+    base = f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
+    query = "&".join(f"{k}={v}" for k, v in items)
+    return f"{method.upper()} {base}?{query}"
+
+
+class TTLCache:
+    """线程安全的 LRU 缓存，每个条目有独立的过期时间
+
+    stale_ttl 大于 0 时，条目过期后继续保留这段时间，可通过 get_stale 取出。
+    attach 到持久化存储后，写入的条目同时备份到磁盘，重启后可恢复。
+    """
+
+    def __init__(self, max_entries=512, stale_ttl=0):
+        self.max_entries = max_entries
+        self.stale_ttl = stale_ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._persistent = None  # (PersistentStore, 类别)
+
+    def attach(self, store, kind):
+        """读入持久化存储中仍在保留期内的条目，之后的写入同步备份"""
+        entries = store.load(kind)
+        with self._lock:
+            for key, value, expires_at, _ in entries:
+                self._data[key] = (value, expires_at)
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+            self._persistent = (store, kind)
+        return len(entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            now = time.time()
+            if expires_at <= now:
+                if expires_at + self.stale_ttl <= now:
+                    del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def get_stale(self, key):
+        """返回 (值, 过期时间戳)，不论是否过期；超过保留期或不存在时返回 (None, None)"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None, None
+            value, expires_at = item
+            if expires_at + self.stale_ttl <= time.time():
+                del self._data[key]
+                return None, None
+            return value, expires_at
+
+    def set(self, key, value, ttl):
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        if self._persistent:
+            store, kind = self._persistent
+            store.put(kind, key, value, expires_at, expires_at + self.stale_ttl)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+        if item and self._persistent:
+            store, kind = self._persistent
+            store.delete(kind, key)
+        return item[0] if item else default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ResponseCache:
+    """make_request 使用的上游响应缓存
+
+    缓存键由请求方法、URL 和归一化后的参数组成，token 不参与计算，
+    因此同一份数据在所有群之间共享，日志里也不会出现 token。
+    """
+
+    def __init__(self, policies=None, max_entries=512, stale_ttl=DEFAULT_STALE_TTL, swr_window=DEFAULT_SWR_WINDOW,
+                 persistent=None):
+        self.policies = dict(DEFAULT_CACHE_POLICIES)
+        self.policies.update(policies or {})
+        # 优先匹配更具体的接口名，例如 tianqi/seven 先于 tianqi
+        self._policy_names = sorted(self.policies, key=len, reverse=True)
+        self.swr_window = swr_window
+        self.store = TTLCache(max_entries, stale_ttl=stale_ttl)
+        if persistent:
+            loaded = self.store.attach(persistent, "response")
+            logger.info(f"[Apilot] response cache warmed with {loaded} persisted entries")
+
+    @classmethod
+    def from_config(cls, conf, persistent=None):
+        conf = conf or {}
+        return cls(policies=conf.get("cache_ttl"), max_entries=conf.get("cache_max_entries", 512),
+                   stale_ttl=conf.get("cache_stale_ttl", DEFAULT_STALE_TTL),
+                   swr_window=conf.get("cache_swr_window", DEFAULT_SWR_WINDOW), persistent=persistent)
+
+    def policy_for(self, url):
+        path = urlparse(url).path.rstrip("/")
+        for name in self._policy_names:
+            if path.endswith("/" + name) or ("/" + name + "/") in path:
+                return self.policies[name]
+        return None
+
+    def make_key(self, method, url, params=None, data=None, json_data=None):
+        """返回缓存键，接口未配置缓存时返回 None；键中不含 token，可直接打印"""
+        if not self.policy_for(url):
+            return None
+        return request_key(method, url, params, data, json_data)
+
+    def ttl_for(self, url, payload):
+        policy = self.policy_for(url)
+        if policy == "midnight":
+            if not self._is_today(payload):
+                return NOT_YET_PUBLISHED_TTL
+            return seconds_until_midnight()
+        return int(policy) if policy else 0
+
+    @staticmethod
+    def _is_today(payload):
+        date = payload_date(payload)
+        if date is None:
+            return True
+        return date == datetime.now().strftime("%Y-%m-%d")
+
+    @staticmethod
+    def is_cacheable(payload):
+        if not isinstance(payload, dict):
+            return False
+        return payload.get("success") is True or payload.get("code") == 200
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def get_revalidatable(self, key):
+        """过期不超过 swr_window 的数据，可以先返回再在后台刷新"""
+        value, expires_at = self.store.get_stale(key)
+        if value is not None and time.time() - expires_at <= self.swr_window:
+            return value
+        return None
+
+    def get_fallback(self, key):
+        """上游失败时的兜底数据，带上 STALE_MARKER 标记"""
+        value, expires_at = self.store.get_stale(key)
+        if value is None:
+            return None
+        value = dict(value)
+        value[STALE_MARKER] = expires_at
+        return value
+
+    def set(self, key, url, payload):
+        if not self.is_cacheable(payload):
+            return
+        ttl = self.ttl_for(url, payload)
+        if ttl > 0:
+            self.store.set(key, payload, ttl)
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """合并相同 key 的并发调用
+
+    第一个调用方执行 func，同时到达的其他调用方等待并共享它的结果(或异常)，
+    调用结束后 key 立即释放，之后的调用会重新执行。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
@@ -0,0 +1,181 @@
+import bisect
+import difflib
+import json
+import os
+import threading
+import uuid
+from common.log import logger
+
+# 城市名常见后缀，查询时去掉后再匹配
+CITY_SUFFIXES = ("市", "县", "区", "镇")
+
+# 城市索引的行格式
+FIELDS = ("city_id", "name", "province", "leader", "pinyin", "aliases")
+
+
+class CityMatch:
+    """城市解析结果
+
+    status 为 "found" 时 rows 只有一条；"ambiguous" 表示同名城市有多个；
+    "unknown" 表示索引中没有，rows 为空，suggestions 为相近的城市名。
+    """
+
+    def __init__(self, status, rows=(), suggestions=()):
+        self.status = status
+        self.rows = list(rows)
+        self.suggestions = list(suggestions)
+
+    @property
+    def city_id(self):
+        return self.rows[0][0] if self.status == "found" else None
+
+
+class CityIndex:
+    """本地城市索引，将城市名、别名、拼音解析为 city_id
+
+    数据来自插件目录下的 city-index.json(可用 tools/build_city_index.py 生成)，
+    并合并 duplicate-citys.json 中的同名城市。行以元组保存，名称索引只存行号。
+    索引中没有的地名按名称请求接口后，接口返回的 city_id 记录到 learned_path，之后同名查询直接按 id 请求。
+    """
+
+    def __init__(self, rows, complete=False, learned_path=None):
+        # 只有加载了完整城市表时才做前缀/模糊匹配，并在本地拒绝未知地名
+        self.complete = complete
+        self.learned_path = learned_path
+        self._learned = {}  # 城市名 -> [city_id, 省份]
+        self._lock = threading.Lock()
+        self.rows = []
+        self._row_ids = {}
+        self.names = {}  # 名称/别名/拼音 -> 行号列表
+        for row in rows:
+            self._add(row)
+        self._sorted_names = sorted(self.names)
+        self.leaders = {row[3] for row in self.rows if row[3]} | {row[2] for row in self.rows if row[2]}
+
+    def _add(self, row):
+        row = tuple(row) + ("",) * (len(FIELDS) - len(row))
+        row = row[:5] + (tuple(row[5] or ()),)
+        if row[0] in self._row_ids:
+            return
+        self._row_ids[row[0]] = len(self.rows)
+        self.rows.append(row)
+        keys = {row[1], row[4].lower()} | set(row[5])
+        for key in keys:
+            if key:
+                self.names.setdefault(key, []).append(len(self.rows) - 1)
+
+    @classmethod
+    def load(cls, plugin_dir):
+        rows = []
+        complete = False
+        index_path = os.path.join(plugin_dir, "city-index.json")
+        if os.path.exists(index_path):
+            with open(index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            rows.extend(data["rows"])
+            # 自带的城市表只有地级市和直辖市的区，标记为不完整
+            complete = data.get("complete", True)
+        duplicate_path = os.path.join(plugin_dir, "duplicate-citys.json")
+        with open(duplicate_path, "r", encoding="utf-8") as f:
+            for name, info in json.load(f).items():
+                for entry in info["data"]:
+                    rows.append((entry["city_id"], name, entry["province"], entry["leader"], "", ()))
+        learned_path = os.path.join(plugin_dir, "cache", "city-learned.json")
+        index = cls(rows, complete=complete, learned_path=learned_path)
+        try:
+            with open(learned_path, "r", encoding="utf-8") as f:
+                for name, (city_id, province) in json.load(f).items():
+                    index._learn(name, city_id, province)
+        except (OSError, ValueError):
+            pass
+        logger.info(f"[Apilot] city index loaded: {len(index.rows)} cities, {len(index.names)} names, "
+                    f"{len(index._learned)} learned")
+        return index
+
+    def _learn(self, name, city_id, province):
+        if not name or self.names.get(name):
+            return False
+        row_id = self._row_ids.get(city_id)
+        if row_id is None:
+            self._add((city_id, name, province, "", "", ()))
+        else:
+            self.names[name] = [row_id]
+        bisect.insort(self._sorted_names, name)
+        self._learned[name] = [city_id, province]
+        return True
+
+    def learn(self, name, city_id, province=""):
+        """记下接口按名称查询返回的 city_id，之后同名查询在本地解析为 id"""
+        with self._lock:
+            if not self._learn(name, str(city_id), province) or not self.learned_path:
+                return
+            learned = dict(self._learned)
+        os.makedirs(os.path.dirname(self.learned_path), exist_ok=True)
+        tmp_path = f"{self.learned_path}.{uuid.uuid4().hex}.part"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(learned, f, ensure_ascii=False)
+            os.replace(tmp_path, self.learned_path)
+        except OSError as e:
+            logger.error(f"[Apilot] 保存城市索引失败: {e}")
+
+    def _lookup(self, name):
+        return [self.rows[i] for i in self.names.get(name, ())]
+
+    @staticmethod
+    def _strip_suffix(query):
+        for suffix in CITY_SUFFIXES:
+            if query.endswith(suffix) and len(query) > len(suffix) + 1:
+                return query[:-len(suffix)]
+        return query
+
+    def _prefix_matches(self, prefix):
+        start = bisect.bisect_left(self._sorted_names, prefix)
+        matches = []
+        for name in self._sorted_names[start:]:
+            if not name.startswith(prefix):
+                break
+            matches.append(name)
+        return matches
+
+    def _resolve_exact(self, query):
+        candidates = [query, self._strip_suffix(query), query.lower()]
+        for name in candidates:
+            rows = self._lookup(name)
+            if rows:
+                return CityMatch("found" if len(rows) == 1 else "ambiguous", rows)
+
+        # 带上级城市或省份的写法，例如 "长春朝阳"、"辽宁朝阳"
+        for leader in self.leaders:
+            if query.startswith(leader) and len(query) > len(leader):
+                rest = self._strip_suffix(query[len(leader):])
+                rows = [row for row in self._lookup(rest) if leader in (row[2], row[3])]
+                if len(rows) == 1:
+                    return CityMatch("found", rows)
+        return None
+
+    def contains(self, query):
+        """索引中是否有这个城市(包括同名的多个城市)，只做精确匹配，不做前缀和模糊匹配"""
+        return self._resolve_exact(query.strip()) is not None
+
+    def resolve(self, query):
+        query = query.strip()
+        match = self._resolve_exact(query)
+        if match is not None:
+            return match
+
+        if not self.complete:
+            return CityMatch("unknown")
+
+        # 前缀匹配，例如 "乌鲁" -> 乌鲁木齐
+        prefix_names = self._prefix_matches(self._strip_suffix(query))
+        if prefix_names:
+            rows = {row for name in prefix_names for row in self._lookup(name)}
+            if len(rows) == 1:
+                return CityMatch("found", rows)
+
+        # 模糊匹配：两个字的地名差一个字就完全不同，只作为提示，不自动纠正
+        suggestions = difflib.get_close_matches(query, self._sorted_names, n=3, cutoff=0.5)
+        if len(query) >= 3 and len(suggestions) == 1 and len(self._lookup(suggestions[0])) == 1:
+            return CityMatch("found", self._lookup(suggestions[0]))
+        return CityMatch("unknown", suggestions=suggestions + prefix_names[:3])
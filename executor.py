@@ -0,0 +1,113 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from common.log import logger
+
+
+class DeadlineWatcher:
+    """用一个后台线程统一处理所有指令的截止时间，避免每个指令单独起定时器线程"""
+
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._loop, name="apilot-deadline", daemon=True)
+        self._thread.start()
+
+    def schedule(self, delay, callback):
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._counter), callback))
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                due, _, callback = self._heap[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"[Apilot] deadline callback failed: {e}")
+
+
+class CommandExecutor:
+    """有界的指令执行线程池
+
+    同时排队和执行的指令数不超过 max_pending，超出时 submit 返回 None，由调用方直接回复繁忙提示。
+    """
+
+    def __init__(self, max_workers=8, max_pending=64):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="apilot-worker")
+        self.watcher = DeadlineWatcher()
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            return None
+        try:
+            future = self.pool.submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run_deferred(self, future, deadline, on_done, on_timeout):
+        """指令在 deadline 秒内完成时调用 on_done(future)，否则调用 on_timeout()，二者只会执行一个"""
+        lock = threading.Lock()
+        state = {"finished": False}
+
+        def claim():
+            with lock:
+                if state["finished"]:
+                    return False
+                state["finished"] = True
+                return True
+
+        def done(f):
+            if claim():
+                on_done(f)
+
+        def expire():
+            if claim():
+                on_timeout()
+
+        self.watcher.schedule(deadline, expire)
+        future.add_done_callback(done)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
+
+
+def fan_out(pool, tasks, timeout):
+    """并发执行多个任务，共享同一个超时时间
+
+    Args:
+        pool: 执行任务的线程池
+        tasks: {key: 无参函数}
+        timeout: 所有任务共享的超时时间(秒)
+
+    Returns:
+        (results, errors, timed_out): 成功结果 {key: 返回值}、失败的任务 {key: 异常}、超时未完成的 key 列表
+    """
+    futures = {pool.submit(func): key for key, func in tasks.items()}
+    done, not_done = wait(futures, timeout=timeout)
+    results, errors = {}, {}
+    for future in done:
+        key = futures[future]
+        try:
+            results[key] = future.result()
+        except Exception as e:
+            errors[key] = e
+    for future in not_done:
+        # 还没开始执行的任务直接取消，正在执行的任务由 HTTP 超时兜底
+        future.cancel()
+    return results, errors, [futures[future] for future in not_done]
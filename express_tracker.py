@@ -0,0 +1,214 @@
+import json
+import os
+import threading
+import time
+import uuid
+from common.log import logger
+
+# ALAPI 快递接口的状态码：1 暂无记录，2 在途中，3 派送中，4 已签收，5 拒签，6 疑难件，7 无效单，8 超时单，9 签收失败，10 退回
+# 到达这些状态后不会再有新动态，推送最后一次后取消订阅
+FINAL_STATUSES = {4, 5, 7, 10}
+
+# 各状态的基础轮询间隔(秒)，派送中最频繁
+STATUS_INTERVALS = {1: 7200, 2: 3600, 3: 900, 6: 3600, 8: 7200, 9: 1800}
+DEFAULT_INTERVAL = 3600
+# 连续没有新动态时间隔逐次翻倍，最长不超过这个值
+MAX_INTERVAL = 6 * 3600
+# 查询失败后的重试间隔
+ERROR_INTERVAL = 1800
+
+DEFAULT_MAX_AGE_DAYS = 15
+DEFAULT_BATCH_SIZE = 10
+DEFAULT_MAX_PER_CHAT = 10
+TICK_SECONDS = 60
+
+
+def next_interval(status, unchanged_polls):
+    base = STATUS_INTERVALS.get(status, DEFAULT_INTERVAL)
+    return min(MAX_INTERVAL, base * 2 ** min(unchanged_polls, 8))
+
+
+class ExpressTracker:
+    """快递订阅的后台轮询
+
+    同一个单号只保存一份，订阅它的所有会话共享查询结果。后台线程每分钟取出到期的单号，
+    每轮最多查询 batch_size 个；有新动态时只把新增的物流信息推送给订阅者，签收等终态后自动取消订阅。
+
+    Args:
+        path: 订阅数据的保存路径，重启后恢复
+        fetch: fetch(单号) -> 接口返回的 data 字典，失败时抛出异常或返回 None
+        notify: notify(订阅者, 文本)，订阅者为订阅时传入的字典
+    """
+
+    def __init__(self, path, fetch, notify, batch_size=DEFAULT_BATCH_SIZE, max_per_chat=DEFAULT_MAX_PER_CHAT,
+                 max_age_days=DEFAULT_MAX_AGE_DAYS):
+        self.path = path
+        self.fetch = fetch
+        self.notify = notify
+        self.batch_size = batch_size
+        self.max_per_chat = max_per_chat
+        self.max_age = max_age_days * 86400
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.items = {}  # 单号 -> 订阅状态
+        self._load()
+
+    @classmethod
+    def from_config(cls, conf, plugin_dir, fetch, notify):
+        conf = conf or {}
+        path = os.path.join(plugin_dir, "cache", "express-subscriptions.json")
+        return cls(path, fetch, notify,
+                   batch_size=conf.get("express_poll_batch", DEFAULT_BATCH_SIZE),
+                   max_per_chat=conf.get("express_max_subscriptions", DEFAULT_MAX_PER_CHAT),
+                   max_age_days=conf.get("express_subscription_days", DEFAULT_MAX_AGE_DAYS))
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.items = json.load(f)
+        except (OSError, ValueError):
+            self.items = {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{uuid.uuid4().hex}.part"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.items, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"[Apilot] 保存快递订阅失败: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def start(self):
+        """启动轮询线程；恢复的订阅需要在能够推送消息后再调用"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._loop, name="apilot-express", daemon=True)
+        self._thread.start()
+
+    def subscriptions(self, chat_id):
+        with self._lock:
+            return [(number, item) for number, item in self.items.items()
+                    if any(s["receiver"] == chat_id for s in item["subscribers"])]
+
+    def subscribe(self, number, subscriber, data):
+        """订阅单号，data 为订阅时查询到的结果，之后只推送比它新的动态
+
+        Returns:
+            str: 提示文本
+        """
+        with self._lock:
+            count = sum(1 for item in self.items.values()
+                        if any(s["receiver"] == subscriber["receiver"] for s in item["subscribers"]))
+            item = self.items.get(number)
+            if item and any(s["receiver"] == subscriber["receiver"] for s in item["subscribers"]):
+                return f"已订阅过快递 {number}"
+            if count >= self.max_per_chat:
+                return f"每个会话最多订阅 {self.max_per_chat} 个快递，请先取消不需要的订阅"
+            if item is None:
+                status = int(data.get("status") or 0)
+                info = data.get("info") or []
+                item = self.items[number] = {
+                    "subscribers": [],
+                    "status": status,
+                    "status_desc": data.get("status_desc", ""),
+                    "last_time": info[-1]["time"] if info else "",
+                    "unchanged": 0,
+                    "created_at": time.time(),
+                    "next_poll": time.time() + next_interval(status, 0),
+                }
+            item["subscribers"].append(subscriber)
+            self._save()
+        self.start()
+        return f"已订阅快递 {number}，有新动态时会通知你，发送“取消订阅快递{number}”可取消"
+
+    def unsubscribe(self, number, chat_id):
+        with self._lock:
+            item = self.items.get(number)
+            if not item:
+                return False
+            subscribers = [s for s in item["subscribers"] if s["receiver"] != chat_id]
+            if len(subscribers) == len(item["subscribers"]):
+                return False
+            if subscribers:
+                item["subscribers"] = subscribers
+            else:
+                del self.items[number]
+            self._save()
+            return True
+
+    def _loop(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"[Apilot] express poll failed: {e}")
+            with self._lock:
+                if not self.items:
+                    self._thread = None
+                    return
+            self._wakeup.wait(TICK_SECONDS)
+            self._wakeup.clear()
+
+    def poll(self):
+        """查询到期的单号，每个单号只查询一次，无论有多少个会话订阅"""
+        now = time.time()
+        with self._lock:
+            expired = [number for number, item in self.items.items() if now - item["created_at"] > self.max_age]
+            for number in expired:
+                del self.items[number]
+            due = sorted((item["next_poll"], number) for number, item in self.items.items() if item["next_poll"] <= now)
+            if expired:
+                self._save()
+        for _, number in due[:self.batch_size]:
+            try:
+                data = self.fetch(number)
+            except Exception as e:
+                logger.warn(f"[Apilot] express poll {number} failed: {e}")
+                data = None
+            self._update(number, data)
+
+    def _update(self, number, data):
+        with self._lock:
+            item = self.items.get(number)
+            if item is None:
+                return
+            if not data:
+                item["next_poll"] = time.time() + ERROR_INTERVAL
+                self._save()
+                return
+            status = int(data.get("status") or 0)
+            new_entries = [info for info in data.get("info") or [] if info.get("time", "") > item["last_time"]]
+            changed = bool(new_entries) or status != item["status"]
+            if new_entries:
+                item["last_time"] = new_entries[-1]["time"]
+            item["status"] = status
+            item["status_desc"] = data.get("status_desc", item["status_desc"])
+            item["unchanged"] = 0 if changed else item["unchanged"] + 1
+            item["next_poll"] = time.time() + next_interval(status, item["unchanged"])
+            subscribers = list(item["subscribers"])
+            final = status in FINAL_STATUSES
+            if final:
+                del self.items[number]
+            self._save()
+        if changed:
+            text = format_update(number, data, new_entries, final)
+            for subscriber in subscribers:
+                try:
+                    self.notify(subscriber, text)
+                except Exception as e:
+                    logger.error(f"[Apilot] express notify {subscriber.get('receiver')} failed: {e}")
+
+
+def format_update(number, data, entries, final):
+    lines = [f"📦 快递 {number} 有新动态", f"状态：{data.get('status_desc')}"]
+    for info in entries:
+        lines.append(f"{info.get('time', '')[5:-3]} - {info.get('status_desc')}\n    {info.get('content')}")
+    if final:
+        lines.append("快递已结束，订阅自动取消")
+    return "\n".join(lines)
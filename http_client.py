@@ -0,0 +1,234 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from common.log import logger
+
+# 各上游主机的默认连接池大小，未列出的主机使用 default_pool_size
+DEFAULT_POOL_SIZES = {
+    "api.vvhan.com": 20,
+    "v3.alapi.cn": 20,
+    "dayu.qqsuu.cn": 10,
+}
+
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 10
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF_FACTOR = 0.3
+
+# 只对幂等请求重试，POST 失败直接返回给调用方处理
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS"])
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30
+
+
+class HostBusyError(requests.RequestException):
+    """对同一上游主机的并发请求数已达上限，且在超时时间内没有空出名额"""
+
+
+class CircuitOpenError(requests.RequestException):
+    """上游主机连续失败，熔断期间直接失败，不再发出请求"""
+
+
+class CircuitBreaker:
+    """单个上游主机的熔断器
+
+    连续失败 failure_threshold 次后打开，reset_timeout 秒内的请求直接失败；
+    之后进入半开状态，只放行一个探测请求，成功则关闭，失败则重新打开。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def is_open(self):
+        """熔断中且还没到探测时间，不改变状态，用于在占用 token 等资源前提前判断"""
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def cancel(self):
+        """请求未真正发出(如排队超时)，释放半开状态的探测名额"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+
+def build_retry(retries, backoff_factor):
+    kwargs = {
+        "total": retries,
+        "connect": retries,
+        "read": retries,
+        "status": retries,
+        "backoff_factor": backoff_factor,
+        "status_forcelist": RETRY_STATUS_CODES,
+        "raise_on_status": False,
+    }
+    try:
+        return Retry(allowed_methods=IDEMPOTENT_METHODS, **kwargs)
+    except TypeError:
+        # urllib3 < 1.26 使用旧参数名
+        return Retry(method_whitelist=IDEMPOTENT_METHODS, **kwargs)
+
+
+class HttpClient:
+    """插件共享的 HTTP 客户端
+
+    所有上游请求都通过同一个 requests.Session 发出，按主机复用 keep-alive 连接池，
+    并统一设置连接/读取超时，对幂等的 GET/HEAD 请求做带退避的重试。
+    host_concurrency 可限制对单个主机的并发请求数，防止一个慢上游占满所有工作线程。
+    每个主机有独立的熔断器，上游故障时快速失败，不必每次都等到超时。
+    """
+
+    def __init__(self, pool_sizes=None, default_pool_size=10, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, retries=DEFAULT_RETRIES, backoff_factor=DEFAULT_BACKOFF_FACTOR,
+                 host_concurrency=None, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout=DEFAULT_RESET_TIMEOUT, metrics=None):
+        self.timeout = (connect_timeout, read_timeout)
+        self.metrics = metrics
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers = {}
+        self._breakers_lock = threading.Lock()
+        self._host_slots = {host: threading.BoundedSemaphore(int(limit))
+                            for host, limit in (host_concurrency or {}).items()}
+        self.retry = build_retry(retries, backoff_factor)
+        self.session = requests.Session()
+
+        default_adapter = HTTPAdapter(pool_connections=10, pool_maxsize=default_pool_size, max_retries=self.retry)
+        self.session.mount("https://", default_adapter)
+        self.session.mount("http://", default_adapter)
+
+        sizes = dict(DEFAULT_POOL_SIZES)
+        sizes.update(pool_sizes or {})
+        for host, size in sizes.items():
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=int(size), max_retries=self.retry)
+            self.session.mount(f"https://{host}/", adapter)
+            self.session.mount(f"http://{host}/", adapter)
+        logger.debug(f"[Apilot] http client ready, timeout={self.timeout}, pools={sizes}")
+
+    @classmethod
+    def from_config(cls, conf, metrics=None):
+        conf = conf or {}
+        timeout = conf.get("http_timeout") or [DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT]
+        if isinstance(timeout, (int, float)):
+            timeout = [timeout, timeout]
+        return cls(
+            pool_sizes=conf.get("http_pool_sizes"),
+            connect_timeout=timeout[0],
+            read_timeout=timeout[1],
+            retries=conf.get("http_retries", DEFAULT_RETRIES),
+            backoff_factor=conf.get("http_backoff_factor", DEFAULT_BACKOFF_FACTOR),
+            host_concurrency=conf.get("http_host_concurrency"),
+            failure_threshold=conf.get("circuit_failure_threshold", DEFAULT_FAILURE_THRESHOLD),
+            reset_timeout=conf.get("circuit_reset_timeout", DEFAULT_RESET_TIMEOUT),
+            metrics=metrics,
+        )
+
+    def breaker(self, host):
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            with self._breakers_lock:
+                breaker = self.breakers.setdefault(host, CircuitBreaker(self.failure_threshold, self.reset_timeout))
+        return breaker
+
+    def is_open(self, url):
+        """url 所在的上游主机是否处于熔断中"""
+        breaker = self.breakers.get(urlparse(url).hostname)
+        return breaker is not None and breaker.is_open()
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        host = urlparse(url).hostname
+        breaker = self.breaker(host)
+        if not breaker.allow():
+            self._record_error(host, "CircuitOpenError")
+            raise CircuitOpenError(f"circuit open for {host}")
+        start = time.perf_counter()
+        try:
+            response = self._send(host, method, url, **kwargs)
+        except HostBusyError as e:
+            breaker.cancel()
+            self._record_error(host, type(e).__name__)
+            raise
+        except requests.RequestException as e:
+            breaker.record_failure()
+            self._record_error(host, type(e).__name__)
+            raise
+        except Exception:
+            breaker.cancel()
+            raise
+        if self.metrics:
+            self.metrics.upstream_latency.observe(time.perf_counter() - start, host)
+            self.metrics.upstream_responses.inc(host, response.status_code)
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
+    def _record_error(self, host, error):
+        if self.metrics:
+            self.metrics.upstream_errors.inc(host, error)
+
+    def _send(self, host, method, url, **kwargs):
+        slots = self._host_slots.get(host)
+        if slots is None:
+            return self.session.request(method, url, **kwargs)
+        # 名额只覆盖到收到响应头为止，stream=True 时读取正文不占用名额
+        if not slots.acquire(timeout=self.timeout[1]):
+            raise HostBusyError(f"too many concurrent requests to {host}")
+        try:
+            return self.session.request(method, url, **kwargs)
+        finally:
+            slots.release()
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,146 @@
+import io
+from common.log import logger
+
+# 发送前重新编码的图片来源：render 为文字渲染的图片，download 为下载后转发的图片
+RENDER = "render"
+DOWNLOAD = "download"
+
+DEFAULT_PROFILES = {
+    # 纯文字图片颜色很少，调色板 PNG 体积只有真彩色的几分之一且文字边缘不失真
+    RENDER: {"format": "png", "colors": 64, "max_width": 1080, "max_height": 8000, "max_bytes": 300 * 1024},
+    # 下载的图片在体积和尺寸都未超出时原样转发
+    DOWNLOAD: {"format": "jpeg", "quality": 85, "max_width": 1440, "max_height": 4000, "max_bytes": 500 * 1024},
+}
+
+# 这些渠道发送 WebP 时会被当作文件或无法预览，改用 JPEG
+WEBP_UNSUPPORTED_CHANNELS = {"wx", "wxy", "wechatmp", "wechatmp_service", "wechatcom_app", "wework"}
+
+FORMAT_EXTS = {"png": ".png", "jpeg": ".jpg", "webp": ".webp"}
+# 超出字节预算时 JPEG/WebP 逐步降低的质量，以及仍然超出时每次缩小的比例
+MIN_QUALITY = 50
+QUALITY_STEP = 10
+SCALE_STEP = 0.8
+MAX_SCALE_STEPS = 4
+
+
+class EncodeProfile:
+    def __init__(self, format="png", quality=85, colors=0, max_width=0, max_height=0, max_bytes=0):
+        self.format = format if format in FORMAT_EXTS else "png"
+        self.quality = quality
+        self.colors = colors
+        self.max_width = max_width
+        self.max_height = max_height
+        self.max_bytes = max_bytes
+
+    @property
+    def ext(self):
+        return FORMAT_EXTS[self.format]
+
+    @property
+    def key(self):
+        """参与渲染缓存键，修改编码配置后不会复用按旧配置生成的图片"""
+        return (self.format, self.quality, self.colors, self.max_width, self.max_height, self.max_bytes)
+
+    def fits(self, width, height, size):
+        return ((not self.max_width or width <= self.max_width) and (not self.max_height or height <= self.max_height)
+                and (not self.max_bytes or size <= self.max_bytes))
+
+
+class ImageEncoder:
+    """图片发送前的编码
+
+    按图片来源(渲染/下载)选择编码配置，同一渠道的配置可以单独覆盖。先按最大尺寸等比缩小，
+    再按配置的格式编码；超出字节预算时先降低 JPEG/WebP 质量，仍然超出再逐步缩小尺寸。
+    """
+
+    def __init__(self, profiles):
+        self.profiles = profiles
+
+    @classmethod
+    def from_config(cls, conf, channel_type=""):
+        """image_encoding 按来源覆盖默认配置，image_encoding.channels.<渠道> 再按渠道覆盖"""
+        encoding = (conf or {}).get("image_encoding") or {}
+        channel_overrides = (encoding.get("channels") or {}).get(channel_type) or {}
+        profiles = {}
+        for source, defaults in DEFAULT_PROFILES.items():
+            options = dict(defaults, **(encoding.get(source) or {}), **(channel_overrides.get(source) or {}))
+            if options.get("format") == "webp" and channel_type in WEBP_UNSUPPORTED_CHANNELS:
+                logger.warn(f"[Apilot] channel {channel_type} does not support webp, using jpeg for {source} images")
+                options["format"] = "jpeg"
+            profiles[source] = EncodeProfile(**options)
+        return cls(profiles)
+
+    def profile(self, source):
+        return self.profiles[source]
+
+    def encode(self, image, source):
+        """编码 PIL 图片，返回 (图片数据, 扩展名)"""
+        profile = self.profiles[source]
+        image = _fit(image, profile.max_width, profile.max_height)
+        for _ in range(MAX_SCALE_STEPS + 1):
+            data = None
+            for quality in _qualities(profile):
+                data = _save(image, profile, quality)
+                if not profile.max_bytes or len(data) <= profile.max_bytes:
+                    return data, profile.ext
+            image = image.resize((max(1, int(image.width * SCALE_STEP)), max(1, int(image.height * SCALE_STEP))),
+                                 _resample())
+        logger.warn(f"[Apilot] {source} image still {len(data)} bytes after shrinking, budget {profile.max_bytes}")
+        return data, profile.ext
+
+    def shrink_file(self, path, source):
+        """下载的图片超出尺寸或字节预算时重新编码，返回 (图片数据, 扩展名)；无需处理时返回 None"""
+        from PIL import Image
+        profile = self.profiles[source]
+        with open(path, "rb") as f:
+            data = f.read()
+        with Image.open(io.BytesIO(data)) as image:
+            # 动图重新编码会丢失帧，原样发送
+            if getattr(image, "is_animated", False) or profile.fits(image.width, image.height, len(data)):
+                return None
+            # 调色板图片直接缩放会退化为最近邻采样
+            image = image.convert("RGBA") if image.mode == "P" else image.copy()
+        return self.encode(image, source)
+
+
+def _resample():
+    from PIL import Image
+    return getattr(Image, "Resampling", Image).LANCZOS
+
+
+def _fit(image, max_width, max_height):
+    scale = min(max_width / image.width if max_width else 1, max_height / image.height if max_height else 1)
+    if scale >= 1:
+        return image
+    return image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))), _resample())
+
+
+def _qualities(profile):
+    if profile.format == "png":
+        return [None]
+    qualities = list(range(profile.quality, MIN_QUALITY - 1, -QUALITY_STEP)) or [profile.quality]
+    return qualities if profile.max_bytes else qualities[:1]
+
+
+def _save(image, profile, quality):
+    from PIL import Image
+    buffer = io.BytesIO()
+    if profile.format == "png":
+        if profile.colors:
+            method = getattr(Image, "Quantize", Image).FASTOCTREE
+            image = image.convert("RGB").quantize(colors=profile.colors, method=method)
+        image.save(buffer, format="PNG", optimize=True)
+    else:
+        if image.mode in ("RGBA", "LA", "P"):
+            # 透明部分铺白底，避免 JPEG 中变成黑色
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        if profile.format == "jpeg":
+            image.save(buffer, format="JPEG", quality=quality, optimize=True, progressive=True)
+        else:
+            image.save(buffer, format="WEBP", quality=quality, method=4)
+    return buffer.getvalue()
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from common.log import logger
+
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+# 下载的图片在这段时间内直接复用，超过后带 ETag 重新验证
+DEFAULT_REVALIDATE_AFTER = 3600
+
+INDEX_FILE = "index.json"
+_NAME_RE = re.compile(r"^[0-9a-f]{40}\.(png|jpg|gif|webp)$")
+# _write 和 _save_index 写入的临时文件
+_PART_RE = re.compile(r"^(?:[0-9a-f]{40}\.(?:png|jpg|gif|webp)|" + re.escape(INDEX_FILE) + r")\.[0-9a-f]{32}\.part$")
+
+
+class ImageStore:
+    """插件缓存目录下的图片存储
+
+    下载的图片按 (URL, ETag) 命名，渲染生成的图片按内容哈希命名，相同内容只保存一份。
+    总大小超过 max_bytes 时按最近访问时间淘汰，首次使用时清理本模块未写完的临时文件；
+    缓存目录可以配置为已有目录，其中的其他文件不会被删除。
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES, revalidate_after=DEFAULT_REVALIDATE_AFTER):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        self._lock = threading.Lock()
+        self._files = {}  # 文件名 -> [大小, 最近访问时间]
+        self._urls = {}  # URL -> {"file", "etag", "fetched_at"}
+        # 首次使用时才扫描缓存目录，不拖慢插件加载
+        self._loaded = False
+
+    @classmethod
+    def from_config(cls, conf, plugin_dir):
+        conf = conf or {}
+        root = conf.get("image_cache_dir") or os.path.join(plugin_dir, "cache", "images")
+        max_mb = conf.get("image_cache_max_mb")
+        max_bytes = int(max_mb * 1024 * 1024) if max_mb else DEFAULT_MAX_BYTES
+        return cls(root, max_bytes=max_bytes)
+
+    def ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if not self._loaded:
+                os.makedirs(self.root, exist_ok=True)
+                self._load()
+                self._loaded = True
+
+    def _load(self):
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name == INDEX_FILE or not os.path.isfile(path):
+                continue
+            if _PART_RE.match(name):
+                # 上次退出时未写完的临时文件
+                self._remove(path)
+                continue
+            if not _NAME_RE.match(name):
+                continue
+            stat = os.stat(path)
+            self._files[name] = [stat.st_size, stat.st_mtime]
+        try:
+            with open(os.path.join(self.root, INDEX_FILE), "r", encoding="utf-8") as f:
+                urls = json.load(f)
+            self._urls = {url: entry for url, entry in urls.items() if entry.get("file") in self._files}
+        except (OSError, ValueError):
+            self._urls = {}
+        self._evict()
+        logger.debug(f"[Apilot] image store loaded {len(self._files)} files from {self.root}")
+
+    def _save_index(self):
+        tmp_path = os.path.join(self.root, f"{INDEX_FILE}.{uuid.uuid4().hex}.part")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._urls, f, ensure_ascii=False)
+            os.replace(tmp_path, os.path.join(self.root, INDEX_FILE))
+        except OSError as e:
+            logger.error(f"[Apilot] 保存图片索引失败: {e}")
+            self._remove(tmp_path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _touch(self, name):
+        now = time.time()
+        self._files[name][1] = now
+        try:
+            # 同步更新文件时间，重启后仍按最近访问顺序淘汰
+            os.utime(os.path.join(self.root, name), (now, now))
+        except OSError:
+            pass
+
+    def _evict(self):
+        total = sum(size for size, _ in self._files.values())
+        if total <= self.max_bytes:
+            return
+        for name, (size, _) in sorted(self._files.items(), key=lambda item: item[1][1]):
+            if total <= self.max_bytes:
+                break
+            self._remove(os.path.join(self.root, name))
+            del self._files[name]
+            total -= size
+        live = set(self._files)
+        self._urls = {url: entry for url, entry in self._urls.items() if entry["file"] in live}
+        self._save_index()
+
+    def _write(self, name, chunks):
+        """先写入临时文件再原子替换，返回写入的字节数"""
+        tmp_path = os.path.join(self.root, f"{name}.{uuid.uuid4().hex}.part")
+        size = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in chunks:
+                    if chunk:
+                        f.write(chunk)
+                        size += len(chunk)
+            os.replace(tmp_path, os.path.join(self.root, name))
+        except Exception:
+            self._remove(tmp_path)
+            raise
+        return size
+
+    def get_download(self, url):
+        """返回 (本地路径, ETag, 是否仍在免验证期内)，未缓存时返回 (None, None, False)"""
+        self.ensure_loaded()
+        with self._lock:
+            entry = self._urls.get(url)
+            if not entry or entry["file"] not in self._files:
+                return None, None, False
+            self._touch(entry["file"])
+            fresh = time.time() - entry["fetched_at"] < self.revalidate_after
+            return os.path.join(self.root, entry["file"]), entry.get("etag"), fresh
+
+    def mark_revalidated(self, url):
+        self.ensure_loaded()
+        with self._lock:
+            entry = self._urls.get(url)
+            if entry:
+                entry["fetched_at"] = time.time()
+                self._save_index()
+
+    def put_download(self, url, etag, ext, chunks):
+        """保存下载的图片，返回本地路径"""
+        self.ensure_loaded()
+        name = hashlib.sha1(f"{url}\n{etag or ''}".encode("utf-8")).hexdigest() + ext
+        size = self._write(name, chunks)
+        with self._lock:
+            self._files[name] = [size, time.time()]
+            self._urls[url] = {"file": name, "etag": etag, "fetched_at": time.time()}
+            self._save_index()
+            self._evict()
+        return os.path.join(self.root, name)
+
+    def put_bytes(self, data, ext):
+        """按内容哈希保存图片，相同内容只保存一份，返回本地路径"""
+        self.ensure_loaded()
+        name = hashlib.sha1(data).hexdigest() + ext
+        path = os.path.join(self.root, name)
+        with self._lock:
+            if name in self._files and os.path.isfile(path):
+                self._touch(name)
+                return path
+        size = self._write(name, [data])
+        with self._lock:
+            self._files[name] = [size, time.time()]
+            self._evict()
+        return path
@@ -0,0 +1,325 @@
+import bisect
+import os
+import threading
+import time
+from common.log import logger
+
+# 默认的耗时分桶(秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, value=1):
+        with self._lock:
+            self.values[labelvalues] = self.values.get(labelvalues, 0) + value
+
+    def snapshot(self):
+        """返回 {标签值: 计数} 的副本，可在锁外遍历"""
+        with self._lock:
+            return dict(self.values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labelvalues, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value, *labelvalues):
+        with self._lock:
+            self.values[labelvalues] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}  # 标签值 -> [各分桶计数, 总和, 次数]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self.values.get(labelvalues)
+            if state is None:
+                state = self.values[labelvalues] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def snapshot(self):
+        """返回 {标签值: [各分桶计数, 总和, 次数]} 的副本，可在锁外遍历"""
+        with self._lock:
+            return {labelvalues: [list(counts), total, count] for labelvalues, (counts, total, count) in self.values.items()}
+
+    def time(self, *labelvalues):
+        return _Timer(self, labelvalues)
+
+    def quantile(self, q, *labelvalues):
+        """按分桶估算分位数，返回所在分桶的上界"""
+        with self._lock:
+            state = self.values.get(labelvalues)
+            return self.quantile_of(state, q) if state else None
+
+    def quantile_of(self, state, q):
+        """按 snapshot 中的一项估算分位数"""
+        counts, _, total_count = state
+        if not total_count:
+            return None
+        target = q * total_count
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return float("inf")
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labelvalues, (counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labelnames, labelvalues, ("le", repr(float(bound))))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, labelvalues, ("le", "+Inf"))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, labelvalues)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labelvalues):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labelvalues)
+        return False
+
+
+class MetricsRegistry:
+    """插件内置的指标注册表，输出 Prometheus 文本格式"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name, documentation, labelnames=()):
+        metric = Gauge(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def start_file_export(self, path, interval=30):
+        """定期把指标写入文件；插件重载后同一路径只保留一个写入线程，改为导出新的 registry"""
+        with _exports_lock:
+            export = _file_exports.get(path)
+            if export is not None:
+                export.registry = self
+                export.interval = interval
+                return
+            export = _file_exports[path] = _Export(self, interval=interval)
+
+        def loop():
+            while True:
+                try:
+                    export.registry.write_file(path)
+                except OSError as e:
+                    logger.error(f"[Apilot] 写入指标文件失败: {e}")
+                time.sleep(export.interval)
+
+        threading.Thread(target=loop, name="apilot-metrics-file", daemon=True).start()
+
+    def start_http_export(self, port, host="127.0.0.1"):
+        """在端口上导出指标；插件重载后复用已绑定的端口，改为导出新的 registry"""
+        with _exports_lock:
+            export = _http_exports.get((host, port))
+            if export is not None:
+                export.registry = self
+                return
+            # 只有开启端口导出时才需要 http.server
+            from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+            export = _Export(self)
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    body = export.registry.render().encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass
+
+            try:
+                server = ThreadingHTTPServer((host, port), Handler)
+            except OSError as e:
+                logger.error(f"[Apilot] 无法在 {host}:{port} 导出指标: {e}")
+                return
+            _http_exports[(host, port)] = export
+        threading.Thread(target=server.serve_forever, name="apilot-metrics-http", daemon=True).start()
+        logger.info(f"[Apilot] metrics exported at http://{host}:{port}/metrics")
+
+
+class _Export:
+    """导出目标当前对应的 registry，插件重载时替换"""
+
+    def __init__(self, registry, interval=None):
+        self.registry = registry
+        self.interval = interval
+
+
+# 导出的端口和文件在进程内只有一份，插件重载后由新实例接管；importlib.reload 本模块时沿用原有的记录
+_exports_lock = globals().get("_exports_lock") or threading.Lock()
+_http_exports = globals().get("_http_exports", {})  # (host, port) -> _Export
+_file_exports = globals().get("_file_exports", {})  # 文件路径 -> _Export
+
+
+class ApilotMetrics(MetricsRegistry):
+    """Apilot 使用的各项指标"""
+
+    def __init__(self):
+        super().__init__()
+        self.command_latency = self.histogram(
+            "apilot_command_seconds", "Time spent handling a command", ("command",))
+        self.command_errors = self.counter(
+            "apilot_command_errors_total", "Commands that raised an exception", ("command", "error"))
+        self.upstream_latency = self.histogram(
+            "apilot_upstream_request_seconds", "Upstream HTTP request latency", ("host",))
+        self.upstream_responses = self.counter(
+            "apilot_upstream_responses_total", "Upstream HTTP responses by status code", ("host", "status"))
+        self.upstream_errors = self.counter(
+            "apilot_upstream_errors_total", "Upstream HTTP requests that failed without a response", ("host", "error"))
+        self.render_latency = self.histogram(
+            "apilot_render_seconds", "Time spent rendering text to an image")
+        self.cache_requests = self.counter(
+            "apilot_cache_requests_total", "Cache lookups by result", ("cache", "result"))
+        self.admission_decisions = self.counter(
+            "apilot_admission_total", "Commands by admission decision", ("command", "decision"))
+        self.startup_seconds = self.gauge(
+            "apilot_startup_seconds", "Time spent in each plugin load and warm-up phase", ("phase",))
+
+    def summary(self):
+        """管理员在聊天中查看的简要统计"""
+        lines = ["📊 Apilot 指标", "", "指令(次数 / 平均 / p95)："]
+        # 各指标先在锁内复制再遍历，避免其他线程同时写入时字典大小变化
+        for (command,), state in sorted(self.command_latency.snapshot().items()):
+            _, total, count = state
+            p95 = self.command_latency.quantile_of(state, 0.95)
+            lines.append(f"  {command}: {count} / {total / count * 1000:.0f}ms / ≤{p95 * 1000:.0f}ms")
+
+        lines.append("\n上游(次数 / 平均)：")
+        for (host,), (_, total, count) in sorted(self.upstream_latency.snapshot().items()):
+            lines.append(f"  {host}: {count} / {total / count * 1000:.0f}ms")
+        for (host, error), value in sorted(self.upstream_errors.snapshot().items()):
+            lines.append(f"  {host} {error}: {value}")
+        for (host, status), value in sorted(self.upstream_responses.snapshot().items()):
+            if not str(status).startswith("2"):
+                lines.append(f"  {host} HTTP {status}: {value}")
+
+        render = self.render_latency.snapshot().get(())
+        if render:
+            lines.append(f"\n渲染：{render[2]} 次，平均 {render[1] / render[2] * 1000:.0f}ms")
+
+        rejected = {}
+        for (command, decision), value in self.admission_decisions.snapshot().items():
+            if decision != "admit":
+                rejected.setdefault(decision, 0)
+                rejected[decision] += value
+        if rejected:
+            lines.append("\n准入：" + "，".join(f"{decision} {value}" for decision, value in sorted(rejected.items())))
+
+        startup = sorted(self.startup_seconds.snapshot().items())
+        if startup:
+            lines.append("\n启动耗时：" + "，".join(f"{phase} {seconds * 1000:.0f}ms" for (phase,), seconds in startup))
+
+        caches = {}
+        for (cache, result), value in self.cache_requests.snapshot().items():
+            caches.setdefault(cache, {})[result] = value
+        if caches:
+            lines.append("\n缓存命中率：")
+            for cache, results in sorted(caches.items()):
+                # 兜底返回的过期数据已计入 miss，不重复统计
+                hits = sum(v for k, v in results.items() if k not in ("miss", "fallback"))
+                total = hits + results.get("miss", 0)
+                lines.append(f"  {cache}: {hits / total:.1%} ({hits}/{total})")
+        return "\n".join(lines)
+
+
+class StartupTimer:
+    """记录插件加载各阶段的耗时，每次 mark 记录距上一次 mark 的时间"""
+
+    def __init__(self, started=None):
+        self.phases = []
+        self._last = started or time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def record(self, gauge):
+        for phase, seconds in self.phases:
+            gauge.set(seconds, phase)
+
+    def summary(self):
+        total = sum(seconds for _, seconds in self.phases)
+        detail = ", ".join(f"{phase} {seconds * 1000:.1f}ms" for phase, seconds in self.phases)
+        return f"{total * 1000:.1f}ms ({detail})"
@@ -0,0 +1,72 @@
+import re
+
+# 省级行政区全称后缀，归一化时去掉
+PROVINCE_SUFFIXES = ("壮族自治区", "回族自治区", "维吾尔自治区", "特别行政区", "自治区", "省", "市")
+
+# 简称及常见写法 -> 归一化后的省份名
+PROVINCE_ALIASES = {
+    "京": "北京", "津": "天津", "沪": "上海", "渝": "重庆", "冀": "河北", "晋": "山西", "蒙": "内蒙古", "内蒙": "内蒙古",
+    "辽": "辽宁", "吉": "吉林", "黑": "黑龙江", "苏": "江苏", "浙": "浙江", "皖": "安徽", "闽": "福建", "赣": "江西",
+    "鲁": "山东", "豫": "河南", "鄂": "湖北", "湘": "湖南", "粤": "广东", "桂": "广西", "琼": "海南", "川": "四川",
+    "蜀": "四川", "黔": "贵州", "贵": "贵州", "滇": "云南", "云": "云南", "藏": "西藏", "陕": "陕西", "秦": "陕西",
+    "甘": "甘肃", "陇": "甘肃", "青": "青海", "宁": "宁夏", "新": "新疆",
+}
+
+# 查询全国油价时可用的关键词
+NATIONWIDE_QUERIES = ("全国", "全部", "所有", "各省")
+
+_SEPARATOR_RE = re.compile(r"[\s,，、/]+")
+
+
+def normalize_province(name):
+    name = name.strip()
+    for suffix in PROVINCE_SUFFIXES:
+        if name.endswith(suffix) and len(name) > len(suffix) + 1:
+            name = name[:-len(suffix)]
+            break
+    return PROVINCE_ALIASES.get(name, name)
+
+
+def split_provinces(query):
+    return [name for name in _SEPARATOR_RE.split(query) if name]
+
+
+class OilPriceTable:
+    """全国油价表，按归一化的省份名和别名建立索引"""
+
+    def __init__(self, items):
+        self.items = items
+        self.index = {}
+        for item in items:
+            self.index[item["province"]] = item
+            self.index[normalize_province(item["province"])] = item
+
+    def lookup(self, name):
+        return self.index.get(name) or self.index.get(normalize_province(name))
+
+    @staticmethod
+    def format_item(item):
+        return (
+            f"省份: {item['province']}\n"
+            f"89号汽油: {item['o89']} 元/升\n"
+            f"92号汽油: {item['o92']} 元/升\n"
+            f"95号汽油: {item['o95']} 元/升\n"
+            f"98号汽油: {item['o98']} 元/升\n"
+            f"0号柴油: {item['o0']} 元/升\n"
+        )
+
+    def format_nationwide(self):
+        lines = ["全国油价(元/升)：92号 / 95号 / 98号 / 0号柴油"]
+        for item in self.items:
+            lines.append(f"{item['province']}: {item['o92']} / {item['o95']} / {item['o98']} / {item['o0']}")
+        return "\n".join(lines)
+
+    def query(self, query):
+        """支持单个省份、空格或逗号分隔的多个省份以及"全国"查询"""
+        if query.strip() in NATIONWIDE_QUERIES:
+            return self.format_nationwide()
+        output = []
+        for name in split_provinces(query):
+            item = self.lookup(name)
+            output.append(self.format_item(item) if item else f"未找到 {name} 的油价信息")
+        return "\n".join(output)
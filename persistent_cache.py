@@ -0,0 +1,151 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from common.log import logger
+
+DEFAULT_FLUSH_INTERVAL = 5
+# 两次清理过期条目的间隔(秒)
+COMPACT_INTERVAL = 3600
+# 一次清理删除的条目超过这个数量时顺带 VACUUM
+VACUUM_THRESHOLD = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    stale_until REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (kind, key)
+)
+"""
+
+
+class PersistentStore:
+    """缓存的 SQLite 持久化
+
+    写入先放进内存中的待写队列，由后台线程定期批量写入，消息处理线程不等待磁盘；
+    同一个键在两次写入之间多次更新只写最后一次。启动时读出仍在保留期内的条目预热内存缓存，
+    后台线程每小时删除超过保留期的条目。
+
+    Args:
+        path: 数据库文件路径
+        flush_interval: 批量写入的间隔(秒)
+    """
+
+    def __init__(self, path, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._pending = {}  # (kind, key) -> 行，值为 None 表示删除
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._compacted_at = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute(SCHEMA)
+        finally:
+            conn.close()
+        self._thread = threading.Thread(target=self._loop, name="apilot-persist", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    @classmethod
+    def from_config(cls, conf, plugin_dir):
+        """未开启 persistent_cache 或数据库无法打开时返回 None"""
+        conf = conf or {}
+        if not conf.get("persistent_cache"):
+            return None
+        path = conf.get("persistent_cache_path") or os.path.join(plugin_dir, "cache", "apilot-cache.db")
+        try:
+            return cls(path, flush_interval=conf.get("persistent_flush_interval", DEFAULT_FLUSH_INTERVAL))
+        except (OSError, sqlite3.Error) as e:
+            logger.error(f"[Apilot] 打开持久化缓存失败: {e}")
+            return None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def load(self, kind):
+        """读出某类仍在保留期内的条目，返回 [(key, value, expires_at, stale_until)]"""
+        try:
+            conn = self._connect()
+            try:
+                rows = conn.execute(
+                    "SELECT key, value, expires_at, stale_until FROM entries WHERE kind = ? AND stale_until > ? "
+                    "ORDER BY updated_at",
+                    (kind, time.time())).fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"[Apilot] 读取持久化缓存失败: {e}")
+            return []
+        entries = []
+        for key, value, expires_at, stale_until in rows:
+            try:
+                entries.append((key, json.loads(value), expires_at, stale_until))
+            except ValueError:
+                continue
+        return entries
+
+    def put(self, kind, key, value, expires_at, stale_until=None):
+        row = (kind, key, json.dumps(value, ensure_ascii=False), expires_at, stale_until or expires_at, time.time())
+        with self._lock:
+            self._pending[(kind, key)] = row
+
+    def delete(self, kind, key):
+        with self._lock:
+            self._pending[(kind, key)] = None
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        writes = [row for row in pending.values() if row is not None]
+        deletes = [kind_key for kind_key, row in pending.items() if row is None]
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)", writes)
+                    conn.executemany("DELETE FROM entries WHERE kind = ? AND key = ?", deletes)
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"[Apilot] 写入持久化缓存失败: {e}")
+            # 放回队列下次重试，期间更新过的键以新值为准
+            with self._lock:
+                for kind_key, row in pending.items():
+                    self._pending.setdefault(kind_key, row)
+
+    def compact(self):
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    deleted = conn.execute("DELETE FROM entries WHERE stale_until <= ?", (time.time(),)).rowcount
+                if deleted >= VACUUM_THRESHOLD:
+                    conn.execute("VACUUM")
+            finally:
+                conn.close()
+            if deleted:
+                logger.debug(f"[Apilot] persistent cache compacted, {deleted} entries removed")
+        except sqlite3.Error as e:
+            logger.error(f"[Apilot] 清理持久化缓存失败: {e}")
+
+    def _loop(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+            if time.time() - self._compacted_at >= COMPACT_INTERVAL:
+                self._compacted_at = time.time()
+                self.compact()
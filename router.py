@@ -0,0 +1,107 @@
+import re
+from collections import namedtuple
+
+# name: 指令名称，args: 从消息中解析出的参数
+Command = namedtuple("Command", ["name", "args"])
+
+# 完全匹配的关键词
+EXACT_COMMANDS = {
+    "早报": "morning_news",
+    "摸鱼": "moyu",
+    "摸鱼视频": "moyu_video",
+    "八卦": "bagua",
+    "黄金": "gold",
+    "全部热榜": "hot_trends_all",
+    "全网热榜": "hot_trends_all",
+    "apilot指标": "metrics",
+    "我的快递": "express_list",
+}
+
+HOROSCOPE_RE = re.compile(r'^([\u4e00-\u9fa5]{2}座)$')
+HOT_TREND_RE = re.compile(r'(.{1,6})热榜$')
+WORD_RE = re.compile(r'^查字典\s+(.+)$')
+OIL_RE = re.compile(r'^(.{2,7}?)(?:省|市)?油价$')
+MULTI_OIL_RE = re.compile(r'^([^\s,，、]{1,8}(?:[\s,，、]+[^\s,，、]{1,8})+)油价$')
+SEPARATOR_RE = re.compile(r'[\s,，、]+')
+MULTI_WEATHER_RE = re.compile(r'^((?:[^\s,，、]{1,9}[\s,，、]+)+[^\s,，、]{1,9}?)(今天|明天|后天|7天|七天)?(?:的)?天气$')
+# 没有城市表时，多城市天气中每一项只接受 2-7 个汉字的城市名或城市ID
+CITY_TOKEN_RE = re.compile(r'^(?:[\u4e00-\u9fa5]{2,7}|\d{7,9})$')
+WEATHER_DAYS = ("今天", "明天", "后天", "7天", "七天")
+WEATHER_RE = re.compile(r'^(?:(.{2,7}?)(?:市|县|区|镇)?|(\d{7,9}))(:?今天|明天|后天|7天|七天)?(?:的)?天气$')
+
+
+class CommandRouter:
+    """将消息解析为指令
+
+    先查完全匹配的关键词，再按前缀/后缀决定唯一可能的指令，最后才用预编译的正则解析参数，
+    不属于任何指令的普通聊天消息只需要几次字符串比较。匹配优先级与原先的判断顺序一致。
+
+    Args:
+        is_city: 判断多城市天气中的一项是否为已知城市，未提供时只检查格式
+    """
+
+    def __init__(self, is_city=None):
+        self.is_city = is_city
+
+    def _is_city(self, token):
+        if token in WEATHER_DAYS:
+            return False
+        if self.is_city is not None:
+            return self.is_city(token)
+        return CITY_TOKEN_RE.match(token) is not None
+
+    def route(self, content):
+        name = EXACT_COMMANDS.get(content)
+        if name:
+            return Command(name, ())
+
+        if content.startswith("快递"):
+            return Command("express", (content[2:].strip(),))
+
+        if content.startswith("订阅快递"):
+            return Command("express_subscribe", (content[4:].strip(),))
+
+        if content.startswith("取消订阅快递"):
+            return Command("express_unsubscribe", (content[6:].strip(),))
+
+        if content.endswith("座"):
+            match = HOROSCOPE_RE.match(content)
+            if match:
+                return Command("horoscope", (match.group(1),))
+
+        if content.endswith("热榜"):
+            match = HOT_TREND_RE.search(content)
+            if match:
+                return Command("hot_trends", (match.group(1).strip(),))
+
+        if content.startswith("查字典"):
+            match = WORD_RE.match(content)
+            if match:
+                return Command("word", (match.group(1),))
+
+        if content.endswith("油价"):
+            match = OIL_RE.match(content) or MULTI_OIL_RE.match(content)
+            if match:
+                return Command("oil", (match.group(1),))
+
+        if content.endswith("天气"):
+            # 多个城市用空格或逗号分隔，例如 "北京 上海 广州天气"
+            match = MULTI_WEATHER_RE.match(content)
+            if match:
+                tokens = [token for token in SEPARATOR_RE.split(match.group(1)) if token]
+                date = match.group(2)
+                if date is None and tokens[-1] in WEATHER_DAYS:
+                    date = tokens.pop()
+                if len(tokens) == 1:
+                    # "北京 七天天气"
+                    return Command("weather", (tokens[0], date, content))
+                # 只保留能识别的城市，至少两个时才按多城市查询，否则是普通聊天，例如 "今天 真是 好天气"
+                cities = tuple(token for token in tokens if self._is_city(token))
+                if len(cities) >= 2:
+                    return Command("weather_batch", (cities, date))
+                return None
+            match = WEATHER_RE.match(content)
+            if match:
+                return Command("weather", (match.group(1) or match.group(2), match.group(3), content))
+
+        return None
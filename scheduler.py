@@ -0,0 +1,78 @@
+import threading
+from datetime import datetime, timedelta
+from common.log import logger
+
+
+class DailyJob:
+    def __init__(self, name, at, func, retry_interval=600, max_retries=12):
+        hour, minute = (int(x) for x in at.split(":"))
+        self.name = name
+        self.hour = hour
+        self.minute = minute
+        self.func = func
+        self.retry_interval = retry_interval
+        self.max_retries = max_retries
+        self.retries = 0
+        self.next_run = self._next_daily_run()
+
+    def _next_daily_run(self, now=None):
+        now = now or datetime.now()
+        run = now.replace(hour=self.hour, minute=self.minute, second=0, microsecond=0)
+        if run <= now:
+            run += timedelta(days=1)
+        return run
+
+    def run(self):
+        try:
+            done = self.func()
+        except Exception as e:
+            logger.error(f"[Apilot] scheduled job {self.name} failed: {e}")
+            done = False
+        if done or self.retries >= self.max_retries:
+            self.retries = 0
+            self.next_run = self._next_daily_run()
+        else:
+            # 上游还没发布当天内容，稍后重试
+            self.retries += 1
+            self.next_run = datetime.now() + timedelta(seconds=self.retry_interval)
+        logger.debug(f"[Apilot] scheduled job {self.name} next run at {self.next_run}")
+
+
+class DailyScheduler:
+    """在后台线程中按天执行任务
+
+    任务函数返回 True 表示当天已完成；返回 False 或抛出异常时按 retry_interval 重试，
+    最多重试 max_retries 次后顺延到第二天。
+    """
+
+    def __init__(self):
+        self.jobs = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def add_daily(self, name, at, func, retry_interval=600, max_retries=12):
+        with self._lock:
+            self.jobs.append(DailyJob(name, at, func, retry_interval, max_retries))
+        self._wakeup.set()
+        self.start()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._loop, name="apilot-scheduler", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                jobs = list(self.jobs)
+            now = datetime.now()
+            for job in jobs:
+                if job.next_run <= now:
+                    job.run()
+            with self._lock:
+                next_run = min((job.next_run for job in self.jobs), default=None)
+            timeout = 3600 if next_run is None else max(1.0, (next_run - datetime.now()).total_seconds())
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
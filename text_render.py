@@ -0,0 +1,143 @@
+import os
+import re
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont, ImageFilter
+from common.log import logger
+
+# 常见的中文字体路径，按顺序查找第一个存在的
+COMMON_FONTS = [
+    "/System/Library/Fonts/PingFang.ttc",  # macOS
+    "C:/Windows/Fonts/msyh.ttc",  # Windows
+    "C:/Windows/Fonts/simhei.ttf",  # Windows
+    "/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf",  # Linux
+]
+
+# 英文单词、数字等连续的非空白 ASCII 片段尽量不在中间断行
+_TOKEN_RE = re.compile(r"[\x21-\x7e]+|\s+|.", re.S)
+
+
+@lru_cache(maxsize=None)
+def find_font_path(font_path=None):
+    if font_path and os.path.exists(font_path):
+        return font_path
+    for f in COMMON_FONTS:
+        if os.path.exists(f):
+            return f
+    return None
+
+
+class Font:
+    """字体及其字形宽度表
+
+    每个字符的宽度只测量一次，之后按字符查表累加，避免每行都调用 getbbox。
+    """
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        try:
+            self.font = ImageFont.truetype(path, size) if path else ImageFont.load_default()
+        except Exception as e:
+            logger.error(f"加载字体失败: {e}，使用默认字体")
+            self.font = ImageFont.load_default()
+        bbox = self.font.getbbox("测试")
+        self.line_height = bbox[3] - bbox[1]
+        self._widths = {}
+
+    def _advance(self, ch):
+        if hasattr(self.font, "getlength"):
+            return self.font.getlength(ch)
+        bbox = self.font.getbbox(ch)
+        return bbox[2] - bbox[0]
+
+    def char_width(self, ch):
+        width = self._widths.get(ch)
+        if width is None:
+            width = self._widths[ch] = self._advance(ch)
+        return width
+
+    def measure(self, text):
+        return sum(self.char_width(ch) for ch in text)
+
+
+@lru_cache(maxsize=32)
+def get_font(path, size):
+    return Font(path, size)
+
+
+def wrap_text(line, font, max_width):
+    """按实际像素宽度贪心断行"""
+    lines = []
+    current = ""
+    current_width = 0
+    for token in _TOKEN_RE.findall(line):
+        token_width = font.measure(token)
+        if current_width + token_width <= max_width:
+            current += token
+            current_width += token_width
+            continue
+        if current.strip():
+            lines.append(current.rstrip())
+        current, current_width = "", 0
+        if token.isspace():
+            continue
+        # 单个片段比整行还宽时按字符拆开
+        if token_width > max_width:
+            for ch in token:
+                ch_width = font.char_width(ch)
+                if current and current_width + ch_width > max_width:
+                    lines.append(current)
+                    current, current_width = "", 0
+                current += ch
+                current_width += ch_width
+        else:
+            current, current_width = token, token_width
+    if current.strip() or not lines:
+        lines.append(current.rstrip())
+    return lines
+
+
+def layout_text(text, title, title_font, body_font, width, padding, line_spacing):
+    """测量排版，返回 (图片高度, [(类型, 文本, y坐标)])，绘制时直接复用结果"""
+    ops = []
+    current_y = padding
+    if title:
+        ops.append(("title", title, current_y))
+        current_y += title_font.line_height + line_spacing * 2
+
+    max_width = width - padding * 2
+    for line in text.split('\n'):
+        if not line.strip():  # 空行处理
+            current_y += line_spacing
+            continue
+        for sub_line in wrap_text(line, body_font, max_width):
+            ops.append(("text", sub_line, current_y))
+            current_y += body_font.line_height + line_spacing
+    return current_y + padding, ops
+
+
+def render_text_image(text, title=None, font_path=None, width=800, padding=20, line_spacing=10,
+                      background_color=(255, 255, 255), title_color=(31, 120, 180), text_color=(0, 0, 0),
+                      shadow=True):
+    """将文本渲染为 PIL 图片，参数含义同 Apilot.text_to_image"""
+    path = find_font_path(font_path)
+    title_font = get_font(path, 28)
+    body_font = get_font(path, 20)
+
+    height, ops = layout_text(text, title, title_font, body_font, width, padding, line_spacing)
+    image = Image.new('RGB', (width, height), background_color)
+    draw = ImageDraw.Draw(image)
+    for line_type, line_text, y in ops:
+        if line_type == "title":
+            draw.text((padding, y), line_text, font=title_font.font, fill=title_color)
+            # 标题下划线
+            underline_y = y + title_font.line_height + line_spacing
+            draw.line([(padding, underline_y), (width - padding, underline_y)], fill=title_color, width=2)
+        else:
+            draw.text((padding, y), line_text, font=body_font.font, fill=text_color)
+
+    if shadow:
+        # 添加轻微的阴影效果
+        blurred = image.filter(ImageFilter.GaussianBlur(radius=1))
+        image = Image.blend(blurred, image, alpha=0.8)
+    return image
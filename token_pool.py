@@ -0,0 +1,267 @@
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import requests
+from common.log import logger
+from .cache import seconds_until_midnight
+
+# 未单独配置时每个 token 的 QPS
+DEFAULT_QPS = 5
+# 没有可用 token 时最多等待的时间(秒)
+DEFAULT_ACQUIRE_TIMEOUT = 2.0
+# 触发频率限制后暂停使用该 token 的时间(秒)
+RATE_LIMIT_COOLDOWN = 60
+# 用量计数最多间隔多久写入一次磁盘(秒)
+SAVE_INTERVAL = 30
+
+# ALAPI 返回的额度/频率错误提示
+QUOTA_ERROR_RE = re.compile(r"次数|额度|余额|用完|上限|quota", re.I)
+RATE_ERROR_RE = re.compile(r"频繁|频率|QPS|too many", re.I)
+
+_TOKEN_PARAM_RE = re.compile(r"(^|&)token=[^&]*")
+
+
+class NoTokenAvailableError(requests.RequestException):
+    """所有 token 都达到限额或被暂停使用"""
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def available(self, now):
+        self._refill(now)
+        return self.tokens
+
+    def take(self):
+        self.tokens -= 1
+
+    def wait_time(self, now):
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class PooledToken:
+    def __init__(self, token, qps, daily_quota):
+        self.token = token
+        # 持久化时只保存指纹，不在磁盘上写入 token
+        self.fingerprint = hashlib.sha1(token.encode("utf-8")).hexdigest()[:12]
+        self.bucket = TokenBucket(qps)
+        self.daily_quota = daily_quota
+        self.used_today = 0
+        self.retired_until = 0
+
+    def headroom(self, now):
+        if self.retired_until > time.time():
+            return None
+        if self.daily_quota and self.used_today >= self.daily_quota:
+            return None
+        remaining = (1 - self.used_today / self.daily_quota) if self.daily_quota else 1.0
+        return remaining, self.bucket.available(now)
+
+
+# 进程内当前使用的 token 池，importlib.reload 本模块时沿用
+_current_pool = globals().get("_current_pool")
+
+
+def _flush_current_pool():
+    if _current_pool is not None:
+        _current_pool.flush()
+
+
+if not globals().get("_flush_registered"):
+    atexit.register(_flush_current_pool)
+    _flush_registered = True
+
+
+class TokenPool:
+    """ALAPI token 池
+
+    每个 token 有独立的令牌桶限制 QPS 和每日调用次数，请求时选择余量最多的 token；
+    ALAPI 返回额度用完时当天不再使用该 token，返回频率限制时暂停一分钟。当日用量保存在插件缓存目录，重启后继续累计。
+    """
+
+    def __init__(self, tokens, path, acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT):
+        self.tokens = tokens
+        self.path = path
+        self.acquire_timeout = acquire_timeout
+        self._by_token = {t.token: t for t in tokens}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._date = datetime.now().strftime("%Y-%m-%d")
+        self._saved_at = 0
+        self._dirty = False
+        # 插件重载时旧的池先保存，新的池读取后接着累计；退出时只保存当前的池
+        global _current_pool
+        previous, _current_pool = _current_pool, self
+        if previous is not None:
+            previous.flush()
+        self._load()
+
+    @classmethod
+    def from_config(cls, conf, plugin_dir):
+        """读取 alapi_tokens，兼容只配置了 alapi_token 的旧配置，没有 token 时返回 None"""
+        conf = conf or {}
+        default_qps = conf.get("alapi_qps", DEFAULT_QPS)
+        entries = list(conf.get("alapi_tokens") or [])
+        if conf.get("alapi_token") and conf["alapi_token"] not in entries:
+            entries.insert(0, conf["alapi_token"])
+        tokens = []
+        for entry in entries:
+            if isinstance(entry, str):
+                entry = {"token": entry}
+            if entry.get("token") and entry["token"] not in (t.token for t in tokens):
+                tokens.append(PooledToken(entry["token"], entry.get("qps", default_qps), entry.get("daily_quota")))
+        if not tokens:
+            return None
+        return cls(tokens, os.path.join(plugin_dir, "cache", "alapi-usage.json"))
+
+    @property
+    def primary(self):
+        return self.tokens[0].token
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        if saved.get("date") != self._date:
+            return
+        for token in self.tokens:
+            state = saved.get("tokens", {}).get(token.fingerprint, {})
+            token.used_today = state.get("used", 0)
+            token.retired_until = state.get("retired_until", 0)
+
+    def _snapshot(self, force=False):
+        """在 self._lock 内调用，需要保存时返回当前用量并视为已保存，否则返回 None"""
+        if not self._dirty or (not force and time.time() - self._saved_at < SAVE_INTERVAL):
+            return None
+        self._saved_at = time.time()
+        self._dirty = False
+        return {"date": self._date, "tokens": {
+            t.fingerprint: {"used": t.used_today, "retired_until": t.retired_until} for t in self.tokens}}
+
+    def _save(self, force=False):
+        """在 self._lock 外调用，文件写入不阻塞其他请求选取 token"""
+        # _save_lock 保证快照按顺序落盘，较旧的快照不会覆盖较新的；定期保存时如果已有线程在写入则跳过，
+        # 未保存的用量留给下一次
+        if not self._save_lock.acquire(blocking=force):
+            return
+        try:
+            with self._lock:
+                state = self._snapshot(force)
+            if state is None:
+                return
+            tmp_path = f"{self.path}.{uuid.uuid4().hex}.part"
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(state, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.error(f"[Apilot] 保存 token 用量失败: {e}")
+                # 下次调用时重试
+                with self._lock:
+                    self._dirty = True
+        finally:
+            self._save_lock.release()
+
+    def flush(self):
+        """立即保存未写入的用量，当前的池在退出时自动调用"""
+        self._save(force=True)
+
+    def _roll_day(self):
+        today = datetime.now().strftime("%Y-%m-%d")
+        if today != self._date:
+            self._date = today
+            for token in self.tokens:
+                token.used_today = 0
+            self._dirty = True
+
+    def acquire(self):
+        """选出余量最多的 token 并占用一次调用，全部不可用时最多等待 acquire_timeout 秒"""
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            with self._lock:
+                self._roll_day()
+                now = time.monotonic()
+                best, best_score, wait = None, None, None
+                for token in self.tokens:
+                    score = token.headroom(now)
+                    if score is None:
+                        continue
+                    if score[1] >= 1 and (best_score is None or score > best_score):
+                        best, best_score = token, score
+                    token_wait = token.bucket.wait_time(now)
+                    wait = token_wait if wait is None else min(wait, token_wait)
+                if best is not None:
+                    best.bucket.take()
+                    best.used_today += 1
+                    self._dirty = True
+            if best is not None:
+                self._save()
+                return best.token
+            if wait is None:
+                raise NoTokenAvailableError("ALAPI token 今日额度已用完或暂停使用")
+            if time.monotonic() + wait > deadline:
+                raise NoTokenAvailableError("ALAPI 请求过于频繁，请稍后再试")
+            time.sleep(wait)
+
+    def release(self, token):
+        """请求没有发出时归还 acquire 占用的调用次数和频率余量"""
+        pooled = self._by_token.get(token)
+        if pooled is None:
+            return
+        with self._lock:
+            pooled.used_today = max(0, pooled.used_today - 1)
+            pooled.bucket.tokens = min(pooled.bucket.capacity, pooled.bucket.tokens + 1)
+            self._dirty = True
+
+    def report(self, token, response_json):
+        """根据接口返回判断 token 是否达到限额"""
+        if not isinstance(response_json, dict) or response_json.get("code") == 200:
+            return
+        pooled = self._by_token.get(token)
+        if pooled is None:
+            return
+        message = str(response_json.get("msg") or response_json.get("message") or "")
+        if response_json.get("status_code") == 429 or RATE_ERROR_RE.search(message):
+            cooldown = RATE_LIMIT_COOLDOWN
+        elif QUOTA_ERROR_RE.search(message):
+            cooldown = seconds_until_midnight()
+        else:
+            return
+        with self._lock:
+            pooled.retired_until = time.time() + cooldown
+            self._dirty = True
+        self._save(force=True)
+        logger.warn(f"[Apilot] ALAPI token {pooled.fingerprint} paused for {cooldown}s: {message}")
+
+    def status(self):
+        with self._lock:
+            now = time.time()
+            return [(t.fingerprint, t.used_today, t.daily_quota, max(0, t.retired_until - now)) for t in self.tokens]
+
+
+def with_token(value, token):
+    """把请求参数中的 token 替换为选中的 token，没有 token 参数的请求原样返回"""
+    if isinstance(value, dict) and "token" in value:
+        return dict(value, token=token)
+    if isinstance(value, str) and _TOKEN_PARAM_RE.search(value):
+        return _TOKEN_PARAM_RE.sub(lambda m: f"{m.group(1)}token={token}", value)
+    return value
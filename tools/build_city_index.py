@@ -0,0 +1,86 @@
+"""生成 Apilot 天气查询使用的本地城市索引 city-index.json
+
+输入为 UTF-8 编码的 CSV 或 JSON 文件：
+  CSV:  每行 city_id,name,province,leader[,aliases]，aliases 为可选的别名列表，用 | 分隔
+  JSON: 中国天气网城市代码格式 [{"provinceName", "cityList": [{"cityName", "cityId"}]}]，
+        地级市的 7 位代码补全为市区站点的 9 位 city_id
+安装了 pypinyin 时会自动生成拼音索引。城市表不包含全部区县时加 --partial，插件不会在本地拒绝索引中没有的地名。
+
+插件自带的 city-index.json 由 weatherChina(MIT) 中的 city.json 生成：
+    python tools/build_city_index.py city.json --partial
+
+用法: python tools/build_city_index.py cities.csv [-o city-index.json] [--partial]
+"""
+import argparse
+import csv
+import json
+import os
+
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:
+    lazy_pinyin = None
+
+FIELDS = ["city_id", "name", "province", "leader", "pinyin", "aliases"]
+
+
+# 直辖市的区县以直辖市为上级城市
+MUNICIPALITIES = {"北京", "上海", "天津", "重庆"}
+# pypinyin 按单字取音读错的多音字地名
+PINYIN_OVERRIDES = {"朝阳": "chaoyang", "长治": "changzhi"}
+
+
+def to_pinyin(name):
+    if name in PINYIN_OVERRIDES:
+        return PINYIN_OVERRIDES[name]
+    return "".join(lazy_pinyin(name)) if lazy_pinyin else ""
+
+
+def build_rows_from_json(json_path):
+    rows = []
+    with open(json_path, "r", encoding="utf-8") as f:
+        provinces = json.load(f)
+    for province in provinces:
+        province_name = province["provinceName"]
+        for city in province["cityList"]:
+            city_id, name = city["cityId"].strip(), city["cityName"].strip()
+            if len(city_id) == 7:
+                city_id += "01"
+            leader = province_name if province_name in MUNICIPALITIES else name
+            pinyin = to_pinyin(name)
+            rows.append([city_id, name, province_name, leader, pinyin, []])
+    return rows
+
+
+def build_rows(csv_path):
+    if csv_path.endswith(".json"):
+        return build_rows_from_json(csv_path)
+    rows = []
+    with open(csv_path, "r", encoding="utf-8") as f:
+        for record in csv.reader(f):
+            if not record or record[0].startswith("#") or not record[0].strip().isdigit():
+                continue
+            city_id, name, province, leader = (field.strip() for field in record[:4])
+            aliases = [a for a in record[4].split("|") if a] if len(record) > 4 else []
+            pinyin = to_pinyin(name)
+            rows.append([city_id, name, province, leader, pinyin, aliases])
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("csv_path")
+    parser.add_argument("-o", "--output",
+                        default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "city-index.json"))
+    parser.add_argument("--partial", action="store_true", help="城市表不完整，只用于解析 city_id")
+    args = parser.parse_args()
+
+    rows = build_rows(args.csv_path)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"fields": FIELDS, "complete": not args.partial, "rows": rows}, f,
+                  ensure_ascii=False, separators=(",", ":"))
+    print(f"wrote {len(rows)} cities to {args.output}" + ("" if lazy_pinyin else " (pypinyin not installed, no pinyin)"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""生成 Apilot 查字典使用的本地字典索引 word-index.bin
+
+输入为 UTF-8 编码的 JSON 或 CSV 文件：
+  JSON: 列表，每项包含 word、pinyin、strokes、radicals(或 radical)、explanation，与常见的新华字典数据格式一致
+  CSV:  每行 字,拼音,笔画,部首,释义
+只收录单个汉字，同一个字出现多次时保留第一条。文件格式见 word_index.py。
+
+用法: python tools/build_word_index.py word.json [-o word-index.bin]
+"""
+import argparse
+import csv
+import json
+import os
+import struct
+import sys
+from array import array
+
+MAGIC = b"APWD"
+VERSION = 1
+HEADER = struct.Struct("<4sII")
+
+
+def read_records(path):
+    """返回 {字: (拼音, 笔画, 部首, 释义)}"""
+    records = {}
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".json"):
+            entries = ((e.get("word", ""), e.get("pinyin", ""), e.get("strokes", ""),
+                        e.get("radicals", e.get("radical", "")), e.get("explanation", "")) for e in json.load(f))
+        else:
+            entries = (tuple(record[:5]) for record in csv.reader(f) if len(record) >= 5 and not record[0].startswith("#"))
+        for word, *fields in entries:
+            word = word.strip()
+            if len(word) == 1 and word not in records:
+                records[word] = tuple(str(field).strip() for field in fields)
+    return records
+
+
+def build_index(records):
+    codepoints = array("I")
+    offsets = array("I", [0])
+    data = bytearray()
+    for char in sorted(records, key=ord):
+        data += "\t".join(field.replace("\t", " ") for field in records[char]).encode("utf-8")
+        codepoints.append(ord(char))
+        offsets.append(len(data))
+    if sys.byteorder != "little":
+        codepoints.byteswap()
+        offsets.byteswap()
+    return HEADER.pack(MAGIC, VERSION, len(codepoints)) + codepoints.tobytes() + offsets.tobytes() + bytes(data)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("source")
+    parser.add_argument("-o", "--output",
+                        default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "word-index.bin"))
+    args = parser.parse_args()
+
+    records = read_records(args.source)
+    content = build_index(records)
+    with open(args.output, "wb") as f:
+        f.write(content)
+    print(f"wrote {len(records)} characters ({len(content) / 1024:.0f} KB) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
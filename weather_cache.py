@@ -0,0 +1,124 @@
+import threading
+import time
+from datetime import datetime
+from .cache import TTLCache, STALE_MARKER, DEFAULT_STALE_TTL, seconds_until_midnight
+
+# 上游大约每隔这么久(秒)更新一次实时天气
+DEFAULT_REFRESH_INTERVAL = 3600
+# update_time 已经过了刷新周期(上游更新延迟)时，短暂缓存后再试
+MIN_TTL = 300
+# 七天预报的缓存时间，最晚到当天结束
+DEFAULT_SEVEN_TTL = 3600
+
+TODAY = "today"
+SEVEN = "seven"
+
+_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class WeatherCache:
+    """按城市缓存天气
+
+    实时天气和七天预报各保存一份，按 city_id 索引，明天/后天/7天都从同一份七天预报中取。
+    实时天气的过期时间由接口返回的 update_time 加上上游的刷新周期决定；逐小时预报只解析一次。
+    按城市名查询时记下接口返回的 city_id，之后同名查询直接命中。
+    """
+
+    def __init__(self, refresh_interval=DEFAULT_REFRESH_INTERVAL, seven_ttl=DEFAULT_SEVEN_TTL,
+                 max_cities=256, stale_ttl=DEFAULT_STALE_TTL):
+        self.refresh_interval = refresh_interval
+        self.seven_ttl = seven_ttl
+        self.store = TTLCache(max_entries=max_cities * 2, stale_ttl=stale_ttl)
+        self.aliases = TTLCache(max_entries=max_cities * 4)  # 城市名 -> city_id
+        self._hours = {}  # (city_id, update_time) -> [(时间, 天气, 温度)]
+        self._hours_lock = threading.Lock()
+        self.max_cities = max_cities
+
+    @classmethod
+    def from_config(cls, conf, persistent=None):
+        conf = conf or {}
+        cache = cls(refresh_interval=conf.get("weather_refresh_interval", DEFAULT_REFRESH_INTERVAL),
+                    seven_ttl=conf.get("weather_seven_ttl", DEFAULT_SEVEN_TTL),
+                    stale_ttl=conf.get("cache_stale_ttl", DEFAULT_STALE_TTL))
+        if persistent:
+            cache.store.attach(persistent, "weather")
+            cache.aliases.attach(persistent, "weather_alias")
+        return cache
+
+    def key_for(self, city_params):
+        """查询参数对应的缓存键：已知 city_id 时为 city_id，否则为 name:城市名"""
+        if "city_id" in city_params:
+            return str(city_params["city_id"])
+        city = city_params.get("city")
+        return self.aliases.get(city) or f"name:{city}"
+
+    def get(self, kind, key):
+        return self.store.get(f"{kind}:{key}")
+
+    def get_fallback(self, kind, key):
+        """上游失败时返回已过期但仍在保留期内的数据，带上 STALE_MARKER"""
+        value, expires_at = self.store.get_stale(f"{kind}:{key}")
+        if value is None:
+            return None
+        return dict(value, **{STALE_MARKER: expires_at})
+
+    def put(self, kind, city_params, payload):
+        """保存接口返回的天气数据，返回缓存键
+
+        始终存在 key_for(city_params) 下，与查询时使用同一个键。按名称查询且还不知道 city_id 时先存在 "name:城市名" 下，
+        实时天气查到 city_id 后再移过去；接口返回的 city_id 与查询的不同时，在返回的 city_id 下也存一份。
+        """
+        data = payload.get("data")
+        first = data[0] if kind == SEVEN and data else data
+        city_id = (first or {}).get("city_id")
+        if city_id and "city" in city_params:
+            self._record_alias(city_params["city"], str(city_id))
+        key = self.key_for(city_params)
+        ttl = self._ttl(kind, first or {})
+        self.store.set(f"{kind}:{key}", payload, ttl)
+        if city_id and str(city_id) != key:
+            self.store.set(f"{kind}:{city_id}", payload, ttl)
+        return key
+
+    def _record_alias(self, city, city_id):
+        if self.aliases.get(city) == city_id:
+            return
+        self.aliases.set(city, city_id, 86400)
+        # 记下 city_id 之前按名称保存的数据移到 city_id 下，之后按名称查询仍能命中
+        for kind in (TODAY, SEVEN):
+            name_key = f"{kind}:name:{city}"
+            value, expires_at = self.store.get_stale(name_key)
+            if value is None:
+                continue
+            self.store.pop(name_key)
+            if self.store.get_stale(f"{kind}:{city_id}")[0] is None:
+                # 保留原来的过期时间，已过期的数据仍可作为兜底
+                self.store.set(f"{kind}:{city_id}", value, expires_at - time.time())
+
+    def _ttl(self, kind, data):
+        if kind == SEVEN:
+            return min(self.seven_ttl, seconds_until_midnight())
+        try:
+            updated_at = datetime.strptime(data["update_time"], _TIME_FORMAT).timestamp()
+        except (KeyError, TypeError, ValueError):
+            return MIN_TTL
+        return min(self.refresh_interval, max(MIN_TTL, updated_at + self.refresh_interval - time.time()))
+
+    def hours(self, data):
+        """实时天气中的逐小时预报，解析后的 [(datetime, 天气, 温度)]，同一份数据只解析一次"""
+        hours_key = (data.get("city_id") or data.get("city"), data.get("update_time"))
+        with self._hours_lock:
+            hours = self._hours.get(hours_key)
+        if hours is not None:
+            return hours
+        hours = []
+        for hour_data in data.get("hour", []):
+            try:
+                hours.append((datetime.strptime(hour_data["time"], _TIME_FORMAT), hour_data["wea"], hour_data["temp"]))
+            except (KeyError, ValueError):
+                continue
+        with self._hours_lock:
+            if len(self._hours) >= self.max_cities:
+                self._hours.clear()
+            self._hours[hours_key] = hours
+        return hours
@@ -0,0 +1,76 @@
+import bisect
+import mmap
+import os
+import struct
+import sys
+from array import array
+from common.log import logger
+
+# 字典索引文件格式(小端)：
+#   头部  magic(4) 版本(u32) 字数(u32)
+#   码位  字数 x u32，升序
+#   偏移  (字数 + 1) x u32，记录在数据区中的起止位置
+#   数据  UTF-8 文本，每条记录为 "拼音\t笔画\t部首\t释义"
+MAGIC = b"APWD"
+VERSION = 1
+HEADER = struct.Struct("<4sII")
+FIELDS = ("pinyin", "strokes", "radical", "explanation")
+
+INDEX_FILE = "word-index.bin"
+
+
+class WordIndex:
+    """本地汉字字典
+
+    数据来自插件目录下的 word-index.bin(可用 tools/build_word_index.py 生成)，以 mmap 方式打开，
+    码位和偏移直接在映射的内存上二分查找，只有命中的记录才解码，不会把整本字典读入内存。
+    """
+
+    def __init__(self, buffer):
+        magic, version, count = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"unsupported word index format: {magic!r} v{version}")
+        self._buffer = buffer
+        self.count = count
+        start = HEADER.size
+        self._codepoints = self._u32_array(buffer, start, count)
+        start += count * 4
+        self._offsets = self._u32_array(buffer, start, count + 1)
+        self._data_start = start + (count + 1) * 4
+
+    @staticmethod
+    def _u32_array(buffer, start, count):
+        view = memoryview(buffer)[start:start + count * 4]
+        if sys.byteorder == "little":
+            return view.cast("I")
+        # 大端机器上复制一份并转换字节序
+        values = array("I", view.tobytes())
+        values.byteswap()
+        return values
+
+    @classmethod
+    def load(cls, plugin_dir):
+        """插件目录下没有字典文件时返回 None"""
+        path = os.path.join(plugin_dir, INDEX_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        index = cls(buffer)
+        logger.info(f"[Apilot] word index loaded: {index.count} characters")
+        return index
+
+    def __len__(self):
+        return self.count
+
+    def lookup(self, char):
+        """返回 {word, pinyin, strokes, radical, explanation}，字典中没有时返回 None"""
+        codepoint = ord(char)
+        i = bisect.bisect_left(self._codepoints, codepoint)
+        if i >= self.count or self._codepoints[i] != codepoint:
+            return None
+        start = self._data_start + self._offsets[i]
+        end = self._data_start + self._offsets[i + 1]
+        values = self._buffer[start:end].decode("utf-8").split("\t", len(FIELDS) - 1)
+        return dict(zip(FIELDS, values), word=char)
+